@@ -0,0 +1,187 @@
+# Alert storm suppression.
+#
+# Repeated alerts for the same disaster (and location, when one is given) are
+# collapsed into one `alerts` row while they keep arriving within
+# ALERT_WINDOW_S seconds of each other (a sliding window). The row carries an
+# occurrence count, the peak probability and first/last-seen timestamps.
+# The first alert of a storm is inserted immediately; later ones only update
+# the in-memory group, which is written back at most once per ALERT_COOLDOWN_S
+# seconds (and when the storm ends or the process exits). If the open row was
+# deleted or marked handled in the meantime, the occurrences since its last
+# write start a new row instead of being folded into one nobody sees.
+#
+# Opt-in, since it changes what predict() writes:
+#   ALERT_WINDOW_S=300     sliding window; 0 (default) disables suppression
+#   ALERT_COOLDOWN_S=30    minimum seconds between updates of an open row
+import os
+import time
+import atexit
+import threading
+
+from utils_db import write_alert_groups
+
+ALERT_WINDOW_S = float(os.environ.get("ALERT_WINDOW_S", 0))
+ALERT_COOLDOWN_S = float(os.environ.get("ALERT_COOLDOWN_S", 30))
+
+
+def _ts(t: float) -> str:
+    # same format as sqlite's CURRENT_TIMESTAMP (UTC)
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(t))
+
+
+class _Group:
+    __slots__ = ("id", "disaster", "location", "message", "probability", "peak",
+                 "occurrences", "first_seen", "last_seen", "written_at", "dirty",
+                 "unsaved", "unsaved_peak", "unsaved_since")
+
+    def __init__(self, disaster, location, probability, message, now):
+        self.id = None
+        self.disaster = disaster
+        self.location = location
+        self.message = message
+        self.probability = probability
+        self.peak = probability
+        self.occurrences = 1
+        self.first_seen = now
+        self.last_seen = now
+        self.written_at = None
+        self.dirty = True
+        # occurrences not yet in the row, to start a new one if the row is gone
+        self.unsaved = 1
+        self.unsaved_peak = probability
+        self.unsaved_since = now
+
+    def add(self, probability, message, now):
+        if not self.unsaved:
+            self.unsaved_peak, self.unsaved_since = probability, now
+        self.unsaved += 1
+        self.unsaved_peak = max(self.unsaved_peak, probability)
+        self.occurrences += 1
+        self.probability = probability
+        self.message = message
+        self.peak = max(self.peak, probability)
+        self.last_seen = now
+        self.dirty = True
+
+    def restart(self):
+        # the row was deleted or handled: only the unsaved occurrences form the new one
+        self.id = None
+        self.occurrences = self.unsaved
+        self.peak = self.unsaved_peak
+        self.first_seen = self.unsaved_since
+
+
+class AlertSuppressor:
+    """
+    In-memory sliding-window deduplication in front of the alerts table.
+    Thread-safe; one instance per process (see SUPPRESSOR).
+    """
+
+    def __init__(self, window: float = ALERT_WINDOW_S, cooldown: float = ALERT_COOLDOWN_S,
+                 clock=time.time):
+        self.window = window
+        self.cooldown = cooldown
+        self.clock = clock
+        self._groups = {}  # (disaster, location) -> _Group
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+        self.received = 0
+        self.suppressed = 0
+        self.inserts = 0
+        self.updates = 0
+        self.restarts = 0
+        atexit.register(self.flush)
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def submit(self, disaster: str, probability: float, message: str, location: str = None):
+        self.submit_many([(disaster, probability, message, location)])
+
+    def submit_many(self, rows):
+        """rows: (disaster, probability, message[, location]) tuples."""
+        with self._lock:
+            now = self.clock()
+            due = []
+            for row in rows:
+                disaster, probability, message = row[:3]
+                location = row[3] if len(row) > 3 else None
+                self.received += 1
+                key = (disaster, location)
+                g = self._groups.get(key)
+                if g is None or now - g.last_seen > self.window:
+                    if g is not None and g.dirty:
+                        due.append(g)  # final counts of the storm that just ended
+                    g = self._groups[key] = _Group(disaster, location, probability, message, now)
+                    due.append(g)
+                    continue
+                self.suppressed += 1
+                g.add(probability, message, now)
+                if g.written_at is not None and now - g.written_at >= self.cooldown:
+                    due.append(g)
+            if now >= self._next_prune:
+                due.extend(self._prune(now))
+            self._write(due, now)
+
+    def flush(self):
+        """Write every group with unsaved occurrences."""
+        with self._lock:
+            self._write([g for g in self._groups.values() if g.dirty], self.clock())
+
+    def reset(self):
+        with self._lock:
+            self._groups.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"received": self.received, "suppressed": self.suppressed,
+                    "inserts": self.inserts, "updates": self.updates, "restarts": self.restarts,
+                    "open_groups": len(self._groups)}
+
+    # -- internals ------------------------------------------------------
+    def _prune(self, now):
+        # forget storms that ended; returns the ones still needing a final write
+        expired = [k for k, g in self._groups.items() if now - g.last_seen > self.window]
+        due = [self._groups[k] for k in expired if self._groups[k].dirty]
+        for k in expired:
+            del self._groups[k]
+        self._next_prune = now + max(self.window / 2, 1.0)
+        return due
+
+    def _write(self, groups, now):
+        inserts, updates, seen = [], [], set()
+        for g in groups:
+            if id(g) in seen or not g.dirty:
+                continue
+            seen.add(id(g))
+            if g.id is None:
+                inserts.append(g)
+            else:
+                updates.append(g)
+        if not inserts and not updates:
+            return
+        ids, gone = write_alert_groups(
+            [(g.disaster, g.location, g.probability, g.message, g.occurrences, g.peak,
+              _ts(g.first_seen), _ts(g.last_seen)) for g in inserts],
+            [(g.probability, g.message, g.occurrences, g.peak, _ts(g.last_seen), g.id) for g in updates])
+        for g, new_id in zip(inserts, ids):
+            g.id = new_id
+        gone = set(gone)
+        restarted = [g for g in updates if g.id in gone]
+        for g in inserts + updates:
+            if g.id in gone:
+                continue
+            g.written_at = now
+            g.dirty = False
+            g.unsaved = 0
+        self.inserts += len(inserts)
+        self.updates += len(updates) - len(restarted)
+        if restarted:
+            for g in restarted:
+                g.restart()
+            self.restarts += len(restarted)
+            self._write(restarted, now)
+
+
+SUPPRESSOR = AlertSuppressor()
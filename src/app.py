@@ -1,14 +1,19 @@
 import streamlit as st
-import pandas as pd
 from pathlib import Path
-import sqlite3
 import base64
 import os
-import bcrypt
+import time
+from datetime import timedelta
 
-from utils_db import add_dataset, list_datasets, log_event, list_alerts, add_alert
-from predictors import predict
-from model_utils import load_model
+# pandas, bcrypt and dataset_cache are imported where they are used (admin
+# pages only) to keep worker cold start short.
+from utils_db import log_event, write_behind_stats, get_user
+from model_utils import registry_stats
+from alert_suppression import SUPPRESSOR
+import ui_data
+import storage
+import prediction_cache
+import metrics
 
 # ----------------------------
 # PATH CONFIG
@@ -16,7 +21,18 @@ from model_utils import load_model
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 MODELS_DIR = BASE_DIR / "models"
-DB_PATH = BASE_DIR / "disaster_alert.db"
+
+# Prometheus exposition (see metrics.py): METRICS_PORT serves /metrics,
+# METRICS_TEXTFILE is rewritten after every page render.
+METRICS_PORT = os.environ.get("METRICS_PORT")
+METRICS_TEXTFILE = os.environ.get("METRICS_TEXTFILE")
+if METRICS_PORT:
+    metrics.start_http_server(int(METRICS_PORT))
+
+# Optional in-process log retention (see retention.py), e.g. LOG_RETENTION_EVERY_S=3600
+if os.environ.get("LOG_RETENTION_EVERY_S"):
+    import retention
+    retention.start_background(float(os.environ["LOG_RETENTION_EVERY_S"]))
 
 # ----------------------------
 # STREAMLIT CONFIG
@@ -28,6 +44,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# bring an existing database up to the current schema, once per server process
+ui_data.migrate()
+
+# load models in a background thread once per server process (MODEL_WARM_UP=0 disables)
+ui_data.warm_up()
+
 # ----------------------------
 # LIGHT WHITE/LIGHT-GRAY THEME
 # ----------------------------
@@ -49,14 +71,6 @@ div[data-testid="stTextInput"] > div > div > input {
 # ----------------------------
 # ADMIN AUTH HELPERS
 # ----------------------------
-def get_user(username):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id,username,password_hash,role FROM users WHERE username=?", (username,))
-    row = c.fetchone()
-    conn.close()
-    return row
-
 def require_admin():
     return st.session_state.get("admin_user")
 
@@ -65,6 +79,7 @@ def admin_login_form():
     uname = st.text_input("Username")
     pwd = st.text_input("Password", type="password")
     if st.button("Login"):
+        import bcrypt
         row = get_user(uname)
         if row and bcrypt.checkpw(pwd.encode(), row[2]):
             st.session_state["admin_user"] = {
@@ -77,6 +92,92 @@ def admin_login_form():
         else:
             st.error("Invalid username or password")
 
+# ----------------------------
+# PAGED ALERT VIEW
+# ----------------------------
+DISASTER_TYPES = ["landslide", "wildfire", "cyclone", "earthquake", "flood"]
+
+def render_alert_page(key, page_size=20, show_filters=True, empty_text="No alerts available."):
+    """
+    Render one page of alerts. Only the current page is fetched (keyset
+    pagination); the cursors of previous pages are kept in session_state.
+    """
+    filters = {}
+    if show_filters:
+        f1, f2, f3, f4 = st.columns(4)
+        d = f1.selectbox("Disaster", ["All"] + DISASTER_TYPES, key=f"{key}_disaster")
+        h = f2.selectbox("Status", ["All", "Unhandled", "Handled"], key=f"{key}_handled")
+        since = f3.date_input("From", value=None, key=f"{key}_since")
+        until = f4.date_input("To", value=None, key=f"{key}_until")
+        if d != "All":
+            filters["disaster"] = d
+        if h != "All":
+            filters["handled"] = h == "Handled"
+        if since:
+            filters["since"] = f"{since} 00:00:00"
+        if until:
+            filters["until"] = f"{until + timedelta(days=1)} 00:00:00"
+
+    # reset to the first page whenever the filters change
+    state_key = f"{key}_pages"
+    if st.session_state.get(f"{key}_filters") != filters:
+        st.session_state[f"{key}_filters"] = filters
+        st.session_state[state_key] = [None]
+    pages = st.session_state.setdefault(state_key, [None])
+
+    # bulk actions are admin-only; bulk delete also needs at least one filter
+    if show_filters and require_admin():
+        b1, b2, _ = st.columns([2, 2, 4])
+        if b1.button("Mark all matching handled", key=f"{key}_mark_all"):
+            n = ui_data.mark_alerts_handled(**{k: v for k, v in filters.items() if k != "handled"})
+            log_event("alerts_mark_handled", f"{n} alerts, filters={filters}")
+            st.success(f"{n} alerts marked handled.")
+        if filters and b2.button("Delete all matching", key=f"{key}_delete_all"):
+            n = ui_data.delete_alerts(**filters)
+            log_event("alerts_delete", f"{n} alerts, filters={filters}")
+            st.session_state[state_key] = pages = [None]
+            st.success(f"{n} alerts deleted.")
+
+    alerts, next_cursor = ui_data.alerts_page(limit=page_size, cursor=pages[-1], **filters)
+    if not alerts:
+        st.info(empty_text)
+    for i, a in enumerate(alerts):
+        aid, disaster, prob, msg, ts, handled, location, occurrences, peak, last_seen = a
+        row_color = "#ffffff" if i % 2 == 0 else "#f2f2f2"
+        storm_html = f"<b>Location:</b> {location}<br>" if location else ""
+        if occurrences and occurrences > 1:
+            storm_html += (f"<b>Occurrences:</b> {occurrences} (peak {peak:.2%}, "
+                           f"last seen {last_seen})<br>")
+
+        col1, col2 = st.columns([1, 5])
+        with col1:
+            if st.button("Delete", key=f"{key}_delete_{aid}"):
+                ui_data.delete_alert(aid)
+                st.experimental_rerun()
+
+        with col2:
+            st.markdown(f"""
+                <div style='border:1px solid #ccc; padding:10px; margin-bottom:8px; border-radius:8px; background-color:{row_color}'>
+                    <b>Disaster:</b> {disaster.capitalize()}<br>
+                    <b>Message:</b> {msg}<br>
+                    <b>Probability:</b> {prob:.2%}<br>
+                    <b>Timestamp:</b> {ts}<br>
+                    {storm_html}
+                </div>
+            """, unsafe_allow_html=True)
+
+    prev_col, page_col, next_col = st.columns([1, 4, 1])
+    with prev_col:
+        if len(pages) > 1 and st.button("◀ Newer", key=f"{key}_prev"):
+            pages.pop()
+            st.experimental_rerun()
+    with page_col:
+        st.caption(f"Page {len(pages)}")
+    with next_col:
+        if next_cursor and st.button("Older ▶", key=f"{key}_next"):
+            pages.append(next_cursor)
+            st.experimental_rerun()
+
 # ----------------------------
 # SIDEBAR
 # ----------------------------
@@ -84,16 +185,19 @@ menu = st.sidebar.radio(
     "Navigation",
     ["Home", "Admin", "Alerts"]
 )
+_render_start = time.perf_counter()
 
 # ----------------------------
 # BRANDING HEADER
 # ----------------------------
-logo_path = BASE_DIR / "src" / "assets" / "logo.png"
-if logo_path.exists():
-    with open(logo_path, "rb") as f:
-        logo_b64 = base64.b64encode(f.read()).decode()
-else:
-    logo_b64 = ""
+@st.cache_data
+def load_logo_b64(path):
+    if not path.exists():
+        return ""
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+logo_b64 = load_logo_b64(BASE_DIR / "src" / "assets" / "logo.png")
 
 st.markdown(f"""
 <div style="display:flex; align-items:center; padding:10px 0;">
@@ -114,68 +218,77 @@ if menu == "Home":
 
     # Admin alerts
     st.subheader("Recent Alerts")
-    alerts = list_alerts(unhandled_only=False)
-    if alerts:
-        for i, a in enumerate(alerts):
-            aid, disaster, prob, msg, ts, handled = a
-            row_color = "#ffffff" if i % 2 == 0 else "#f2f2f2"
-
-            col1, col2 = st.columns([1, 5])
-            with col1:
-                if st.button("Delete", key=f"delete_{aid}"):
-                    conn = sqlite3.connect(DB_PATH)
-                    c = conn.cursor()
-                    c.execute("DELETE FROM alerts WHERE id=?", (aid,))
-                    conn.commit()
-                    conn.close()
-                    st.experimental_rerun()
-
-            with col2:
-                st.markdown(f"""
-                    <div style='border:1px solid #ccc; padding:10px; margin-bottom:8px; border-radius:8px; background-color:{row_color}'>
-                        <b>Disaster:</b> {disaster.capitalize()}<br>
-                        <b>Message:</b> {msg}<br>
-                        <b>Probability:</b> {prob:.2%}<br>
-                        <b>Timestamp:</b> {ts}<br>
-                    </div>
-                """, unsafe_allow_html=True)
-    else:
-        st.info("No alerts yet.")
+    render_alert_page("home", page_size=10, show_filters=False, empty_text="No alerts yet.")
 
     st.markdown("---")
 
     # ----------- Prediction -----------
     st.subheader("Predict Disaster Risk")
-    disaster = st.selectbox("Select disaster type", ["landslide", "wildfire", "cyclone", "earthquake", "flood"])
-    model, meta = load_model(disaster) or (None, {})
+    mode = st.radio("Mode", ["Single hazard", "All hazards"], horizontal=True)
+
+    if mode == "All hazards":
+        # one shared record: the union of every available model's features
+        metas = {d: m[1] for d in DISASTER_TYPES if (m := ui_data.model(d))}
+        if not metas:
+            st.warning("Models missing. Train your models using train_models.py.")
+        else:
+            features = list(dict.fromkeys(f for meta in metas.values() for f in meta.get("features", [])))
+            cols = st.columns(2)
+            values = {}
+            for i, feat in enumerate(features):
+                values[feat] = cols[i % 2].number_input(f"{feat}", value=0.0, key=f"all_{feat}")
+            location = st.text_input("Location (optional)", value="", key="all_location").strip() or None
 
-    if model is None:
-        st.warning("Model missing. Train your models using train_models.py.")
+            if st.button("Assess all hazards"):
+                if any(v == 0.0 for v in values.values()):
+                    st.warning("⚠️ Enter all values greater than 0 before predicting.")
+                else:
+                    res = ui_data.predict_all(values, location=location, disasters=list(metas))
+                    import pandas as pd
+                    profile = pd.DataFrame([
+                        {"Hazard": d.capitalize(), "Probability": f"{r['probability']:.2%}",
+                         "Threshold": f"{r['threshold']:.0%}", "Alert": "🚨" if r["alert"] else "",
+                         "Model accuracy": f"{metas[d]['accuracy']:.2%}" if metas[d].get("accuracy") else ""}
+                        for d, r in sorted(res["hazards"].items(), key=lambda kv: -kv[1]["probability"])])
+                    st.dataframe(profile, use_container_width=True, hide_index=True)
+                    if res["alerts"]:
+                        st.error("🚨 HIGH RISK — " + "; ".join(res["hazards"][d]["message"] for d in res["alerts"]))
+                    elif res["highest"]:
+                        st.success(f"Safe — highest risk: {res['hazards'][res['highest']]['message']}")
+                    for d, err in res["errors"].items():
+                        st.warning(f"{d.capitalize()}: {err}")
     else:
-        features = meta.get("features", [])
-        model_acc = meta.get("accuracy", None)
-        cols = st.columns(2)
-        values = {}
-
-        for i, feat in enumerate(features):
-            values[feat] = cols[i % 2].number_input(f"{feat}", value=0.0)
-
-        # --- INPUT VALIDATION ---
-        if st.button("Predict"):
-            if any(v == 0.0 for v in values.values()):
-                st.warning("⚠️ Enter all values greater than 0 before predicting.")
-            else:
-                res = predict(disaster, values)
-                prob = res["probability"]
+        disaster = st.selectbox("Select disaster type", DISASTER_TYPES)
+        model, meta = ui_data.model(disaster) or (None, {})
 
-                st.metric("Prediction Probability", f"{prob:.2%}")
-                if model_acc:
-                    st.metric("Model Accuracy", f"{model_acc:.2%}")
+        if model is None:
+            st.warning("Model missing. Train your models using train_models.py.")
+        else:
+            features = meta.get("features", [])
+            model_acc = meta.get("accuracy", None)
+            cols = st.columns(2)
+            values = {}
+
+            for i, feat in enumerate(features):
+                values[feat] = cols[i % 2].number_input(f"{feat}", value=0.0)
+            location = st.text_input("Location (optional)", value="").strip() or None
 
-                if res["alert"]:
-                    st.error(f"🚨 HIGH RISK — {res['message']}")
+            # --- INPUT VALIDATION ---
+            if st.button("Predict"):
+                if any(v == 0.0 for v in values.values()):
+                    st.warning("⚠️ Enter all values greater than 0 before predicting.")
                 else:
-                    st.success(f"Safe — {res['message']}")
+                    res = ui_data.predict(disaster, values, location=location)
+                    prob = res["probability"]
+
+                    st.metric("Prediction Probability", f"{prob:.2%}")
+                    if model_acc:
+                        st.metric("Model Accuracy", f"{model_acc:.2%}")
+
+                    if res["alert"]:
+                        st.error(f"🚨 HIGH RISK — {res['message']}")
+                    else:
+                        st.success(f"Safe — {res['message']}")
 
 # ----------------------------
 # ADMIN PAGE
@@ -190,11 +303,11 @@ elif menu == "Admin":
 
         # Send manual alert
         st.subheader("Send Manual Alert")
-        md = st.selectbox("Disaster type", ["landslide", "wildfire", "cyclone", "earthquake", "flood"])
+        md = st.selectbox("Disaster type", DISASTER_TYPES)
         mp = st.number_input("Probability", min_value=0.0, max_value=1.0, step=0.01)
         mm = st.text_input("Alert message", value=f"{md.capitalize()} alert")
         if st.button("Send Alert"):
-            add_alert(md, mp, mm)
+            ui_data.add_alert(md, mp, mm)
             log_event("manual_alert", f"{md}, prob={mp}, msg={mm}")
             st.success("Alert sent successfully.")
 
@@ -208,12 +321,18 @@ elif menu == "Admin":
             path = DATA_DIR / fname
             with open(path, "wb") as f:
                 f.write(uploaded.getbuffer())
-            add_dataset(fname.replace(".csv", ""), fname)
-            log_event("dataset_upload", fname)
-            st.success("Dataset uploaded successfully.")
+            ui_data.add_dataset(fname.replace(".csv", ""), fname)
+            from dataset_cache import build_cache
+            try:
+                build_cache(path)
+            except Exception as e:
+                st.error(f"Dataset saved, but it could not be parsed as CSV: {e}")
+            else:
+                log_event("dataset_upload", fname)
+                st.success("Dataset uploaded successfully.")
 
         st.markdown("### Existing Datasets")
-        rows = list_datasets()
+        rows = ui_data.datasets()
         if rows:
             for i, row in enumerate(rows):
                 row_color = "#ffffff" if i % 2 == 0 else "#f2f2f2"
@@ -224,11 +343,7 @@ elif menu == "Admin":
                         try:
                             if file_path.exists():
                                 os.remove(file_path)
-                            conn = sqlite3.connect(DB_PATH)
-                            c = conn.cursor()
-                            c.execute("DELETE FROM datasets WHERE filename=?", (row[2],))
-                            conn.commit()
-                            conn.close()
+                            ui_data.delete_dataset(row[2])
                             log_event("dataset_delete", row[2])
                             st.success(f"{row[2]} deleted successfully.")
                             st.experimental_rerun()
@@ -243,37 +358,44 @@ elif menu == "Admin":
                     """, unsafe_allow_html=True)
         else:
             st.info("No datasets uploaded.")
+        if st.button("Reload models", help="Pick up retrained models now instead of within a minute"):
+            ui_data.bump("models")
+
+        st.markdown("---")
+
+        # Instrumentation
+        st.subheader("Metrics")
+        enabled = st.checkbox("Collect timing metrics", value=metrics.ENABLED)
+        if enabled != metrics.ENABLED:
+            metrics.enable() if enabled else metrics.disable()
+        import pandas as pd
+        rows = metrics.snapshot()
+        if rows:
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        else:
+            st.info("No timings recorded yet." if metrics.ENABLED else "Metrics collection is off.")
+        counters = metrics.counters()
+        if counters:
+            st.dataframe(pd.DataFrame(counters.items(), columns=["counter", "value"]), hide_index=True)
+        with st.expander("Model registry / caches / write-behind / alert suppression / DB pool"):
+            st.json({"model_registry": registry_stats(), "prediction_cache": prediction_cache.CACHE.stats(),
+                     "write_behind": write_behind_stats(), "alert_suppression": SUPPRESSOR.stats(),
+                     "db_pool": storage.pool_stats()})
+        c1, c2 = st.columns(2)
+        c1.download_button("Download Prometheus metrics", metrics.render_prometheus(),
+                           file_name="disaster_metrics.prom", mime="text/plain")
+        if c2.button("Reset metrics"):
+            metrics.reset()
+            st.experimental_rerun()
 
 # ----------------------------
 # ALERTS PAGE
 # ----------------------------
 elif menu == "Alerts":
     st.header("All Alerts")
-    alerts = list_alerts(unhandled_only=False)
-    if alerts:
-        for i, a in enumerate(alerts):
-            aid, disaster, prob, msg, ts, handled = a
-            row_color = "#ffffff" if i % 2 == 0 else "#f2f2f2"
-
-            col1, col2 = st.columns([1,5])
-            with col1:
-                if st.button("Delete", key=f"alert_delete_{aid}"):
-                    conn = sqlite3.connect(DB_PATH)
-                    c = conn.cursor()
-                    c.execute("DELETE FROM alerts WHERE id=?", (aid,))
-                    conn.commit()
-                    conn.close()
-                    st.experimental_rerun()
-
-            with col2:
-                st.markdown(f"""
-                    <div style='border:1px solid #ccc; padding:10px; margin-bottom:8px; border-radius:8px; background-color:{row_color}'>
-                        <b>Disaster:</b> {disaster.capitalize()}<br>
-                        <b>Message:</b> {msg}<br>
-                        <b>Probability:</b> {prob:.2%}<br>
-                        <b>Timestamp:</b> {ts}<br>
-                    </div>
-                """, unsafe_allow_html=True)
+    render_alert_page("alerts", page_size=25)
 
-    else:
-        st.info("No alerts available.")
+if metrics.ENABLED:
+    metrics.observe("page_render", time.perf_counter() - _render_start, page=menu.lower())
+    if METRICS_TEXTFILE:
+        metrics.write_prometheus(METRICS_TEXTFILE)
@@ -0,0 +1,193 @@
+# Replay a historical CSV through a model for a whole sweep of thresholds.
+#
+# The CSV has the data/<disaster>_dataset.csv schema plus, optionally, a
+# timestamp column. Chunks are scored in a process pool through
+# predictors.predict_batch(record=False) -- nothing is written to the alerts or
+# logs tables -- and only small aggregates come back from the workers, so the
+# replay runs in memory regardless of file size. Per threshold it reports:
+#   * alert counts per time bucket (--bucket, e.g. 1h or 1D; one bucket if the
+#     CSV has no timestamp column)
+#   * precision and recall against the label column (if present and 0/1)
+#   * throughput in rows/s
+# Each row is scored once: with thresholds sorted, a row alerts for exactly the
+# first k thresholds, k = searchsorted(thresholds, p, "right"), so the sweep
+# costs one histogram of k per bucket regardless of how many thresholds it has.
+#
+#   python src/backtest.py flood history.csv --thresholds 0.3 0.4 0.5 0.6 0.7 --bucket 1D
+#   python src/backtest.py landslide history.csv --sweep 0.05 0.95 0.05 --buckets-csv alerts_by_day.csv
+import os
+import time
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+
+from model_utils import load_model
+from predictors import predict_batch, THRESHOLDS
+
+_worker = {}
+
+
+def _init_worker(disaster, thresholds):
+    model, _ = load_model(disaster)
+    if hasattr(model, "n_jobs"):
+        model.n_jobs = 1  # parallelism comes from the process pool
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    _worker.update(disaster=disaster, thresholds=np.asarray(thresholds, dtype=float))
+
+
+def _score_chunk(task):
+    """(X, labels or None, bucket ids) -> (rows, {bucket: alerts per k}, positives per k, negatives per k)."""
+    X, labels, buckets = task
+    thresholds = _worker["thresholds"]
+    proba = predict_batch(_worker["disaster"], X, record=False)["probability"]
+    # k = number of thresholds this row reaches (thresholds are sorted ascending)
+    k = np.searchsorted(thresholds, proba, side="right")
+    width = len(thresholds) + 1
+    ids, inverse = np.unique(buckets, return_inverse=True)
+    per_bucket = np.bincount(inverse * width + k, minlength=len(ids) * width).reshape(len(ids), width)
+    pos = neg = None
+    if labels is not None:
+        pos = np.bincount(k[labels == 1], minlength=width)
+        neg = np.bincount(k[labels == 0], minlength=width)
+    return len(X), dict(zip(ids.tolist(), per_bucket)), pos, neg
+
+
+def _tasks(csv_path, features, label_col, time_col, bucket, chunksize):
+    bucket_ns = pd.Timedelta(bucket).value if bucket else None
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk = chunk.dropna(subset=[f for f in features if f in chunk.columns])
+        X = chunk.reindex(columns=features, fill_value=0).to_numpy(dtype=float)
+        labels = None
+        if label_col in chunk.columns and pd.api.types.is_numeric_dtype(chunk[label_col]):
+            labels = chunk[label_col].to_numpy()
+        if time_col in chunk.columns and bucket_ns:
+            ts = pd.to_datetime(chunk[time_col]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+            buckets = ts // bucket_ns * bucket_ns
+        else:
+            buckets = np.zeros(len(X), dtype=np.int64)
+        yield X, labels, buckets
+
+
+def backtest(disaster: str, csv_path: str, thresholds=None, bucket: str = "1D", time_col: str = "timestamp",
+             label_col: str = "label", chunksize: int = 50000, workers: int = None) -> dict:
+    """Replay csv_path through the `disaster` model; returns totals, per-threshold metrics and per-bucket counts."""
+    model_meta = load_model(disaster)
+    if not model_meta:
+        raise ValueError(f"Model for {disaster} not found. Train models first.")
+    features = model_meta[1].get("features", [])
+    thresholds = np.unique(np.asarray(thresholds if thresholds is not None else [THRESHOLDS.get(disaster, 0.6)],
+                                      dtype=float))
+    width = len(thresholds) + 1
+
+    rows = 0
+    buckets = {}
+    pos = np.zeros(width, dtype=np.int64)
+    neg = np.zeros(width, dtype=np.int64)
+    labelled = False
+
+    def merge(result):
+        nonlocal rows, labelled
+        n, per_bucket, p, q = result
+        rows += n
+        for b, counts in per_bucket.items():
+            if b in buckets:
+                buckets[b] += counts
+            else:
+                buckets[b] = counts.astype(np.int64)
+        if p is not None:
+            labelled = True
+            pos[:] += p
+            neg[:] += q
+
+    tasks = _tasks(csv_path, features, label_col, time_col, bucket, chunksize)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(disaster, thresholds)
+        for task in tasks:
+            merge(_score_chunk(task))
+    else:
+        # at most 2 chunks per worker in flight, so the file is never read ahead into memory
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(disaster, thresholds)) as pool:
+            pending = set()
+            for task in tasks:
+                pending.add(pool.submit(_score_chunk, task))
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        merge(fut.result())
+            for fut in pending:
+                merge(fut.result())
+    elapsed = time.perf_counter() - start
+
+    # counts per k -> counts per threshold: threshold i is reached by every row with k > i
+    def reached(counts):
+        return np.cumsum(counts[::-1])[::-1][1:]
+
+    tp, fp = reached(pos), reached(neg)
+    positives = int(pos.sum())
+    results = []
+    for i, t in enumerate(thresholds):
+        alerts = int(sum(reached(c)[i] for c in buckets.values()))
+        results.append({
+            "threshold": float(t),
+            "alerts": alerts,
+            "alert_rate": alerts / rows if rows else 0.0,
+            "precision": float(tp[i] / (tp[i] + fp[i])) if labelled and tp[i] + fp[i] else None,
+            "recall": float(tp[i] / positives) if labelled and positives else None,
+        })
+    bucket_rows = [{"bucket": pd.Timestamp(b) if bucket and b else None,
+                    **{float(t): int(n) for t, n in zip(thresholds, reached(c))}}
+                   for b, c in sorted(buckets.items())]
+    return {"rows": rows, "seconds": elapsed, "rows_per_s": rows / elapsed if elapsed > 0 else 0.0,
+            "thresholds": results, "buckets": bucket_rows, "current_threshold": THRESHOLDS.get(disaster, 0.6)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a historical CSV over a sweep of alert thresholds "
+                                                 "(no database writes).")
+    parser.add_argument("disaster", choices=sorted(THRESHOLDS))
+    parser.add_argument("input")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--thresholds", type=float, nargs="*", help="candidate thresholds")
+    group.add_argument("--sweep", type=float, nargs=3, metavar=("START", "STOP", "STEP"),
+                       help="thresholds START, START+STEP, ... up to STOP")
+    parser.add_argument("--bucket", default="1D", help="time bucket width, e.g. 15min, 1h, 1D (default 1D)")
+    parser.add_argument("--time-col", default="timestamp")
+    parser.add_argument("--label-col", default="label")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--buckets-csv", default=None, help="write alert counts per bucket and threshold here")
+    args = parser.parse_args()
+
+    thresholds = args.thresholds
+    if args.sweep:
+        start, stop, step = args.sweep
+        thresholds = np.round(np.arange(start, stop + step / 2, step), 6)
+    try:
+        res = backtest(args.disaster, args.input, thresholds, bucket=args.bucket, time_col=args.time_col,
+                       label_col=args.label_col, chunksize=args.chunksize, workers=args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Replayed {res['rows']} rows in {res['seconds']:.2f}s — {res['rows_per_s']:.0f} rows/s")
+    print(f"{'threshold':>10}{'alerts':>10}{'rate':>9}{'precision':>11}{'recall':>9}")
+    for r in res["thresholds"]:
+        precision = "-" if r["precision"] is None else f"{r['precision']:.3f}"
+        recall = "-" if r["recall"] is None else f"{r['recall']:.3f}"
+        current = "  (current)" if r["threshold"] == res["current_threshold"] else ""
+        print(f"{r['threshold']:>10.3f}{r['alerts']:>10}{r['alert_rate']:>9.2%}{precision:>11}{recall:>9}{current}")
+    if len(res["buckets"]) > 1:
+        counts = pd.DataFrame(res["buckets"]).set_index("bucket")
+        print(f"\nAlerts per {args.bucket} bucket ({len(counts)} buckets):")
+        print(counts.describe().loc[["mean", "50%", "max"]].round(1).to_string())
+    if args.buckets_csv:
+        pd.DataFrame(res["buckets"]).to_csv(args.buckets_csv, index=False)
+        print(f"Per-bucket counts written to {args.buckets_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# Offline performance benchmarks for the inference, storage, UI-data and
+# training paths. Everything runs in a temporary directory (own SQLite file,
+# models dir and dataset cache) against data/*.csv or synthetic scale-ups of it.
+#
+#   python src/benchmark.py                          # full run -> benchmarks/results.json
+#   python src/benchmark.py --quick                  # smaller sizes, OOB training
+#   python src/benchmark.py --save-baseline          # store this run as the baseline
+#   python src/benchmark.py --baseline benchmarks/baseline.json --tolerance 0.25
+#
+# With a baseline, every metric is compared and the exit code is 1 if any got
+# worse by more than --tolerance (relative).
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import db_init
+import utils_db
+import model_utils
+import forest_compiler
+import dataset_cache
+import predictors
+import train_models
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), "..")
+BENCH_DIR = os.path.join(BASE_DIR, "benchmarks")
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def _percentile_ms(samples, q):
+    return float(np.percentile(np.asarray(samples) * 1000, q))
+
+
+def _metric(value, unit, better="lower"):
+    return {"value": float(value), "unit": unit, "better": better}
+
+
+def setup_sandbox(workdir):
+    """Point every module at files inside workdir."""
+    models = os.path.join(workdir, "models")
+    os.makedirs(models, exist_ok=True)
+    model_utils.MODELS_DIR = models
+    forest_compiler.MODELS_DIR = models
+    model_utils.REGISTRY.invalidate()
+    dataset_cache.CACHE_DIR = os.path.join(workdir, "data_cache")
+    dataset_cache.INDEX_PATH = os.path.join(dataset_cache.CACHE_DIR, "index.json")
+    db = os.path.join(workdir, "bench.db")
+    utils_db.DB_PATH = db
+    db_init.DB_PATH = db
+    db_init.init_db()
+
+
+def scaled_csv(csv_path, scale, workdir, seed=0):
+    """data CSV resampled to `scale` x rows with small multiplicative jitter on float columns."""
+    if scale == 1:
+        return csv_path
+    df = pd.read_csv(csv_path)
+    rng = np.random.default_rng(seed)
+    big = df.sample(int(len(df) * scale), replace=True, random_state=seed).reset_index(drop=True)
+    for col in big.columns:
+        if col != "label" and pd.api.types.is_float_dtype(big[col]):
+            big[col] *= rng.normal(1.0, 0.01, len(big))
+    out = os.path.join(workdir, f"x{scale}_{os.path.basename(csv_path)}")
+    big.to_csv(out, index=False)
+    return out
+
+
+# -- training -------------------------------------------------------------
+def bench_training(workdir, scale, search):
+    results = {}
+    for csv_name, features, name in train_models.DATASETS:
+        csv_path = os.path.join(train_models.DATA_DIR, csv_name)
+        if not os.path.exists(csv_path):
+            continue
+        path = scaled_csv(csv_path, scale, workdir)
+        start = time.perf_counter()
+        try:
+            train_models.train_generic(path, features, model_name=name, search=search)
+        except Exception as e:  # e.g. a single-class dataset the strategy can't score
+            print(f"  {name}: training failed ({e})")
+            continue
+        results[f"train_generic.{name}.wall_s"] = _metric(time.perf_counter() - start, "s")
+    return results
+
+
+def ensure_models():
+    """Small forests for the inference benchmarks when training was skipped."""
+    from sklearn.ensemble import RandomForestClassifier
+    for csv_name, features, name in train_models.DATASETS:
+        if model_utils.model_exists(name):
+            continue
+        df = pd.read_csv(os.path.join(train_models.DATA_DIR, csv_name)).dropna()
+        y = df["label"].astype("category").cat.codes if df["label"].dtype == object else df["label"]
+        if y.nunique() < 2:
+            continue
+        model = RandomForestClassifier(n_estimators=200, random_state=42).fit(df[features], y)
+        train_models.evaluate_and_save(model, df[features], y, features, name)
+
+
+# -- inference ------------------------------------------------------------
+def bench_load_model(names, repeat=20):
+    results = {}
+    for name in names:
+        cold = []
+        for _ in range(max(3, repeat // 4)):
+            model_utils.REGISTRY.invalidate()
+            start = time.perf_counter()
+            model_utils.load_model(name)
+            cold.append(time.perf_counter() - start)
+        warm = []
+        for _ in range(repeat * 10):
+            start = time.perf_counter()
+            model_utils.load_model(name)
+            warm.append(time.perf_counter() - start)
+        results[f"load_model.{name}.cold_ms"] = _metric(_percentile_ms(cold, 50), "ms")
+        results[f"load_model.{name}.warm_ms"] = _metric(_percentile_ms(warm, 50), "ms")
+    return results
+
+
+def bench_predict(names, n_calls):
+    results = {}
+    for name in names:
+        _, meta = model_utils.load_model(name)
+        df = pd.read_csv(os.path.join(train_models.DATA_DIR, f"{name}_dataset.csv"))
+        rows = df[meta["features"]].sample(n_calls, replace=True, random_state=0).to_dict("records")
+        for backend in ("sklearn", "auto"):
+            predictors.PREDICT_BACKEND = backend
+            predictors.predict(name, rows[0])  # warm-up
+            lat = []
+            for row in rows:
+                start = time.perf_counter()
+                predictors.predict(name, row)
+                lat.append(time.perf_counter() - start)
+            results[f"predict.{name}.{backend}.p50_ms"] = _metric(_percentile_ms(lat, 50), "ms")
+            results[f"predict.{name}.{backend}.p99_ms"] = _metric(_percentile_ms(lat, 99), "ms")
+    predictors.PREDICT_BACKEND = os.environ.get("PREDICT_BACKEND", "auto")
+    return results
+
+
+# -- storage --------------------------------------------------------------
+def bench_inserts(n):
+    results = {}
+    for label, fn, args in (("log_event", utils_db.log_event, ("prediction", "flood prob=0.42")),
+                            ("add_alert", utils_db.add_alert, ("flood", 0.91, "Flood probability 0.910"))):
+        start = time.perf_counter()
+        for _ in range(n):
+            fn(*args)
+        results[f"{label}.sync.rows_per_s"] = _metric(n / (time.perf_counter() - start), "rows/s", "higher")
+
+        utils_db.enable_write_behind()
+        start = time.perf_counter()
+        for _ in range(n * 10):
+            fn(*args)
+        utils_db.flush_writes()
+        results[f"{label}.write_behind.rows_per_s"] = _metric(
+            n * 10 / (time.perf_counter() - start), "rows/s", "higher")
+        utils_db.disable_write_behind()
+    return results
+
+
+def _fill_alerts(total):
+    conn = utils_db.get_conn()
+    have = conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+    rng = np.random.default_rng(have)
+    disasters = list(predictors.THRESHOLDS)
+    base = pd.Timestamp("2024-01-01")
+    batch = 50_000
+    while have < total:
+        n = min(batch, total - have)
+        secs = rng.integers(0, 365 * 86400, n)
+        rows = [(disasters[i % len(disasters)], float(p), "synthetic",
+                 str(base + pd.Timedelta(seconds=int(s))), int(h))
+                for i, (p, s, h) in enumerate(zip(rng.random(n), secs, rng.random(n) < 0.5))]
+        conn.executemany("INSERT INTO alerts (disaster, probability, message, timestamp, handled) "
+                         "VALUES (?,?,?,?,?)", rows)
+        conn.commit()
+        have += n
+    conn.close()
+
+
+def bench_list_alerts(sizes, repeat=5):
+    results = {}
+    for size in sizes:
+        _fill_alerts(size)
+        label = f"{size // 1000}k" if size < 1_000_000 else f"{size // 1_000_000}M"
+        full = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            utils_db.list_alerts(unhandled_only=False)
+            full.append(time.perf_counter() - start)
+        page = []
+        for _ in range(repeat * 10):
+            start = time.perf_counter()
+            rows, cursor = utils_db.list_alerts_page(limit=25, disaster="flood")
+            utils_db.list_alerts_page(limit=25, cursor=cursor, disaster="flood")
+            page.append(time.perf_counter() - start)
+        results[f"list_alerts.{label}.full_ms"] = _metric(_percentile_ms(full, 50), "ms")
+        results[f"list_alerts_page.{label}.two_pages_ms"] = _metric(_percentile_ms(page, 50), "ms")
+    return results
+
+
+# -- reporting ------------------------------------------------------------
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\n{'metric':<48}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, cur in sorted(results.items()):
+        base = baseline.get(name)
+        if not base or base["value"] == 0:
+            print(f"{name:<48}{'-':>12}{cur['value']:>12.3f}")
+            continue
+        change = (cur["value"] - base["value"]) / base["value"]
+        worse = change > tolerance if cur["better"] == "lower" else change < -tolerance
+        flag = "  REGRESSION" if worse else ""
+        print(f"{name:<48}{base['value']:>12.3f}{cur['value']:>12.3f}{change:>+9.0%}{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the performance benchmark suite.")
+    parser.add_argument("--quick", action="store_true",
+                        help="small sizes and OOB training (for a fast smoke run)")
+    parser.add_argument("--scale", type=float, default=1, help="training data scale-up factor")
+    parser.add_argument("--train-search", choices=["grid", "halving", "oob"], default=None,
+                        help="search strategy timed for train_generic (default: grid, oob with --quick)")
+    parser.add_argument("--skip-train", action="store_true")
+    parser.add_argument("--output", default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", default=None, help="compare against this results file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"also write {DEFAULT_BASELINE}")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    search = args.train_search or ("oob" if args.quick else "grid")
+    alert_sizes = [10_000, 100_000] if args.quick else [10_000, 100_000, 1_000_000]
+    config = {"quick": args.quick, "scale": args.scale, "train_search": search,
+              "skip_train": args.skip_train, "alert_sizes": alert_sizes}
+
+    workdir = tempfile.mkdtemp(prefix="disaster-bench-")
+    results = {}
+    try:
+        setup_sandbox(workdir)
+        if not args.skip_train:
+            print(f"Training ({search} search, scale x{args.scale})...")
+            results.update(bench_training(workdir, args.scale, search))
+        ensure_models()
+        # predict() needs a two-class model (earthquake_dataset.csv has a single label)
+        names = [name for _, _, name in train_models.DATASETS
+                 if model_utils.model_exists(name) and len(model_utils.load_model(name)[0].classes_) > 1]
+
+        print("load_model...")
+        results.update(bench_load_model(names))
+        print("predict...")
+        results.update(bench_predict(names, n_calls=100 if args.quick else 500))
+        print("inserts...")
+        results.update(bench_inserts(200 if args.quick else 1000))
+        print("list_alerts...")
+        results.update(bench_list_alerts(alert_sizes))
+    finally:
+        utils_db.disable_write_behind()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count()},
+        "config": config,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"\nWrote {len(results)} metrics to {args.output}")
+    if args.save_baseline:
+        shutil.copyfile(args.output, DEFAULT_BASELINE)
+        print(f"Saved baseline to {DEFAULT_BASELINE}")
+
+    baseline_path = args.baseline or (DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE)
+                                      and not args.save_baseline else None)
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"Note: baseline config {baseline.get('config')} differs from this run")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
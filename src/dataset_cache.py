@@ -0,0 +1,274 @@
+# Binary columnar cache for data/*.csv.
+#
+# Each CSV is parsed once into data_cache/<name>-<sha256[:16]>/ (next to data/):
+# one .npy file per column plus meta.json. Float columns are stored as float32
+# (RandomForest casts its input to float32 anyway, so trained models are
+# unchanged), integer columns as the smallest int type that holds their range,
+# and string columns (e.g. label="earthquake") as category codes.
+# Loading memory-maps the .npy files instead of re-parsing the CSV. Building
+# reads the CSV in chunks, so large files never have to fit in memory.
+#
+#   python src/dataset_cache.py                 # build caches for every data/*.csv
+#   python src/dataset_cache.py --measure       # parse time / RSS: CSV vs cache
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+
+from model_utils import file_sha256
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), "..")
+DATA_DIR = os.path.join(BASE_DIR, "data")
+CACHE_DIR = os.path.join(BASE_DIR, "data_cache")
+INDEX_PATH = os.path.join(CACHE_DIR, "index.json")
+# rows per chunk while building a cache
+BUILD_CHUNKSIZE = int(os.environ.get("DATASET_CACHE_CHUNKSIZE", 100_000))
+
+
+def _stem(csv_path: str) -> str:
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def _load_index() -> dict:
+    if not os.path.exists(INDEX_PATH):
+        return {}
+    with open(INDEX_PATH) as f:
+        return json.load(f)
+
+
+def _csv_sha256(csv_path: str) -> str:
+    # size+mtime shortcut so an unchanged CSV is not re-hashed on every load
+    st = os.stat(csv_path)
+    key = os.path.abspath(csv_path)
+    entry = _load_index().get(key)
+    if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+        return entry["sha256"]
+    sha = file_sha256(csv_path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    index = _load_index()
+    index[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha}
+    tmp = INDEX_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, INDEX_PATH)
+    return sha
+
+
+def cache_path(csv_path: str) -> str:
+    return os.path.join(CACHE_DIR, f"{_stem(csv_path)}-{_csv_sha256(csv_path)[:16]}")
+
+
+def _kind(series: pd.Series) -> str:
+    if series.dtype == object or isinstance(series.dtype, pd.CategoricalDtype):
+        return "category"
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_integer_dtype(series):
+        return "int"
+    return "float"
+
+
+def _scan(csv_path: str, chunksize: int):
+    """
+    First pass over the CSV in chunks: row count and, per column, the kind a
+    single pd.read_csv would give it, the integer range and the categories.
+    """
+    names, rows, cols = None, 0, {}
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        if names is None:
+            names = list(chunk.columns)
+            cols = {n: {"kinds": set(), "lo": None, "hi": None, "values": set()} for n in names}
+        rows += len(chunk)
+        for name in names:
+            series, col = chunk[name], cols[name]
+            kind = _kind(series)
+            col["kinds"].add(kind)
+            if kind == "category":
+                col["values"].update(series.dropna())
+            elif kind == "int" and len(series):
+                lo, hi = int(series.min()), int(series.max())
+                col["lo"] = lo if col["lo"] is None else min(col["lo"], lo)
+                col["hi"] = hi if col["hi"] is None else max(col["hi"], hi)
+    if names is None:
+        # header only: pandas reads every column as object
+        names = list(pd.read_csv(csv_path, nrows=0).columns)
+        cols = {n: {"kinds": {"category"}, "lo": None, "hi": None, "values": set()} for n in names}
+
+    plan = {}
+    mixed = []
+    for name in names:
+        kinds = cols[name]["kinds"]
+        if kinds == {"bool"} or kinds == {"int"}:
+            kind = kinds.pop()
+        elif kinds <= {"int", "float"}:
+            kind = "float"
+        else:
+            kind = "category"
+            if kinds != {"category"}:
+                mixed.append(name)
+        plan[name] = {"kind": kind, "lo": cols[name]["lo"] or 0, "hi": cols[name]["hi"] or 0,
+                      "values": cols[name]["values"]}
+    if mixed:
+        # a whole-file read parses such columns as strings; collect them that way
+        for name in mixed:
+            plan[name]["values"] = set()
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, usecols=mixed, dtype=str):
+            for name in mixed:
+                plan[name]["values"].update(chunk[name].dropna())
+    return names, rows, plan, mixed
+
+
+def _dtype(col: dict):
+    if col["kind"] == "category":
+        n = len(col["categories"])
+        return np.dtype(np.int8 if n < 127 else np.int16 if n < 32767 else np.int32)
+    if col["kind"] == "bool":
+        return np.dtype(np.bool_)
+    if col["kind"] == "int":
+        for dtype in (np.int8, np.int16, np.int32, np.int64):
+            info = np.iinfo(dtype)
+            if info.min <= col["lo"] and col["hi"] <= info.max:
+                return np.dtype(dtype)
+    return np.dtype(np.float32)
+
+
+def build_cache(csv_path: str, force: bool = False, chunksize: int = BUILD_CHUNKSIZE) -> str:
+    """
+    Parse csv_path once and write its columnar cache; returns the cache directory.
+    The CSV is read in chunks of `chunksize` rows (twice: once to pick the
+    dtypes, once to fill the memory-mapped columns), so memory stays bounded.
+    """
+    path = cache_path(csv_path)
+    if os.path.exists(os.path.join(path, "meta.json")) and not force:
+        return path
+
+    names, rows, plan, mixed = _scan(csv_path, chunksize)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns, outputs = [], []
+    for i, name in enumerate(names):
+        col = plan[name]
+        info = {"kind": "numeric"}
+        if col["kind"] == "category":
+            # same order as Series.astype("category")
+            col["categories"] = sorted(col["values"])
+            info = {"kind": "category", "categories": col["categories"]}
+        dtype = _dtype(col)
+        outputs.append(np.lib.format.open_memmap(os.path.join(tmp, f"{i}.npy"), mode="w+",
+                                                 dtype=dtype, shape=(rows,)))
+        columns.append(dict(info, name=name, file=f"{i}.npy", dtype=str(dtype)))
+
+    start = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype={n: str for n in mixed} or None):
+        stop = start + len(chunk)
+        for name, out in zip(names, outputs):
+            col = plan[name]
+            if col["kind"] == "category":
+                out[start:stop] = pd.Categorical(chunk[name], categories=col["categories"]).codes
+            else:
+                out[start:stop] = chunk[name].to_numpy(dtype=out.dtype)
+        start = stop
+    for out in outputs:
+        out.flush()
+    del outputs
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"source": os.path.basename(csv_path), "source_sha256": _csv_sha256(csv_path),
+                   "rows": rows, "columns": columns}, f, indent=1)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+    # drop caches of older versions of the same file
+    prefix = f"{_stem(csv_path)}-"
+    for d in os.listdir(CACHE_DIR):
+        if d.startswith(prefix) and os.path.join(CACHE_DIR, d) != path and len(d) == len(prefix) + 16:
+            shutil.rmtree(os.path.join(CACHE_DIR, d), ignore_errors=True)
+    return path
+
+
+def load_columns(csv_path: str, columns=None, mmap: bool = True) -> dict:
+    """{column: array} straight from the cache (memory-mapped, no copy); builds it if missing."""
+    path = build_cache(csv_path)
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    wanted = set(columns) if columns is not None else None
+    out = {}
+    for col in meta["columns"]:
+        if wanted is not None and col["name"] not in wanted:
+            continue
+        arr = np.load(os.path.join(path, col["file"]), mmap_mode="r" if mmap else None)
+        if col["kind"] == "category":
+            arr = pd.Categorical.from_codes(arr, categories=col["categories"])
+        out[col["name"]] = arr
+    return out
+
+
+def read_dataset(csv_path: str, columns=None) -> pd.DataFrame:
+    """Drop-in for pd.read_csv(csv_path) backed by the columnar cache."""
+    cols = load_columns(csv_path, columns)
+    return pd.DataFrame(cols, copy=False)
+
+
+def iter_chunks(csv_path: str, chunksize: int, columns=None):
+    """Like pd.read_csv(csv_path, chunksize=...) but slicing the memory-mapped cache."""
+    cols = load_columns(csv_path, columns)
+    n = len(next(iter(cols.values()))) if cols else 0
+    for start in range(0, n, chunksize):
+        stop = min(start + chunksize, n)
+        yield pd.DataFrame({k: v[start:stop] for k, v in cols.items()}, index=pd.RangeIndex(start, stop))
+
+
+def _measure_one(csv_path: str, mode: str):
+    # run in a fresh interpreter so RSS reflects only this load
+    import resource
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    df = pd.read_csv(csv_path) if mode == "csv" else read_dataset(csv_path)
+    df.sum(numeric_only=True)  # touch every value (pages in mmap'd columns)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"seconds": elapsed, "rss_kb": peak - base,
+                      "frame_bytes": int(df.memory_usage(deep=True).sum())}))
+
+
+def measure(csv_paths):
+    print(f"{'dataset':<28}{'csv ms':>9}{'cache ms':>10}{'csv MB':>9}{'cache MB':>10}{'RSS saved':>11}")
+    for csv_path in csv_paths:
+        build_cache(csv_path)
+        res = {}
+        for mode in ("csv", "cache"):
+            out = subprocess.run([sys.executable, __file__, "--measure-one", mode, csv_path],
+                                 capture_output=True, text=True, check=True)
+            res[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+        saved = res["csv"]["rss_kb"] - res["cache"]["rss_kb"]
+        print(f"{os.path.basename(csv_path):<28}{1000 * res['csv']['seconds']:>9.1f}"
+              f"{1000 * res['cache']['seconds']:>10.1f}{res['csv']['frame_bytes'] / 1e6:>9.2f}"
+              f"{res['cache']['frame_bytes'] / 1e6:>10.2f}{saved / 1024:>9.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build/measure the columnar dataset cache.")
+    parser.add_argument("csv", nargs="*", help="CSV files (default: data/*.csv)")
+    parser.add_argument("--measure", action="store_true")
+    parser.add_argument("--force", action="store_true", help="rebuild even if a cache exists")
+    parser.add_argument("--measure-one", nargs=2, metavar=("MODE", "CSV"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_one:
+        _measure_one(args.measure_one[1], args.measure_one[0])
+        return
+    paths = args.csv or sorted(os.path.join(DATA_DIR, f) for f in os.listdir(DATA_DIR) if f.endswith(".csv"))
+    if args.measure:
+        measure(paths)
+        return
+    for p in paths:
+        print(f"{os.path.basename(p)} -> {build_cache(p, force=args.force)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,85 @@
-# Initialize sqlite DB, create tables, and add a default admin.
-import sqlite3
+# Initialize the DB (SQLite file, or DATABASE_URL -- see storage.py), create tables, and add a default admin.
 import bcrypt
 import os
+from sqlalchemy import text, inspect
+import storage
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "disaster_alert.db")
 DB_PATH = os.path.abspath(DB_PATH)
 
+ALERT_STORM_COLUMNS = {
+    "location": "TEXT",
+    "occurrences": "INTEGER DEFAULT 1",
+    "peak_probability": "REAL",
+    "first_seen": "TEXT",
+    "last_seen": "TEXT",
+}
+
+# the only DDL that differs between SQLite and PostgreSQL
+_DIALECT_TYPES = {
+    "sqlite": {"ID": "INTEGER PRIMARY KEY AUTOINCREMENT", "BLOB": "BLOB"},
+    "postgresql": {"ID": "SERIAL PRIMARY KEY", "BLOB": "BYTEA"},
+}
+
+def add_missing_columns(conn, table: str, columns: dict):
+    existing = {col["name"] for col in inspect(conn).get_columns(table)}
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {decl}"))
+
+def migrate():
+    """Add tables, columns and indexes missing from an existing database (idempotent)."""
+    with storage.begin(DB_PATH) as conn:
+        create_tables(conn)
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    with storage.begin(DB_PATH) as conn:
+        create_tables(conn)
+        # add default admin if not exists
+        if not conn.execute(text("SELECT id FROM users WHERE username=:u"), {"u": "admin"}).first():
+            pw = "adminpass"  # change immediately after first login
+            pw_hash = bcrypt.hashpw(pw.encode(), bcrypt.gensalt())
+            conn.execute(text("INSERT INTO users (username, password_hash, role) VALUES (:u, :pw, :role)"),
+                         {"u": "admin", "pw": pw_hash, "role": "admin"})
+            print("Default admin created: username=admin password=adminpass. Change immediately!")
+
+def create_tables(conn):
+    types = _DIALECT_TYPES.get(conn.dialect.name, _DIALECT_TYPES["sqlite"])
+
+    def ddl(sql):
+        conn.execute(text(sql.format(**types)))
+
     # users: id, username, password_hash, role
-    c.execute('''
+    ddl('''
     CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id {ID},
         username TEXT UNIQUE NOT NULL,
-        password_hash BLOB NOT NULL,
+        password_hash {BLOB} NOT NULL,
         role TEXT NOT NULL
     )
     ''')
     # datasets: id, name, filename, uploaded_at
-    c.execute('''
+    ddl('''
     CREATE TABLE IF NOT EXISTS datasets (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id {ID},
         name TEXT,
         filename TEXT UNIQUE,
         uploaded_at TEXT DEFAULT CURRENT_TIMESTAMP
     )
     ''')
     # logs: id, timestamp, event_type, details
-    c.execute('''
+    ddl('''
     CREATE TABLE IF NOT EXISTS logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id {ID},
         timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
         event_type TEXT,
         details TEXT
     )
     ''')
     # alerts: id, disaster, probability, timestamp, handled
-    c.execute('''
+    ddl('''
     CREATE TABLE IF NOT EXISTS alerts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id {ID},
         disaster TEXT,
         probability REAL,
         message TEXT,
@@ -47,19 +87,27 @@ def init_db():
         handled INTEGER DEFAULT 0
     )
     ''')
-    conn.commit()
-
-    # add default admin if not exists
-    c.execute("SELECT * FROM users WHERE username = ?", ("admin",))
-    if not c.fetchone():
-        pw = "adminpass"  # change immediately after first login
-        pw_hash = bcrypt.hashpw(pw.encode(), bcrypt.gensalt())
-        c.execute("INSERT INTO users (username, password_hash, role) VALUES (?,?,?)",
-                  ("admin", pw_hash, "admin"))
-        conn.commit()
-        print("Default admin created: username=admin password=adminpass. Change immediately!")
-    conn.close()
+    # collapsed alert storms (alert_suppression.py); added to older databases here
+    add_missing_columns(conn, "alerts", ALERT_STORM_COLUMNS)
+    # hourly aggregates of logs rows removed by retention.py
+    ddl('''
+    CREATE TABLE IF NOT EXISTS log_rollups (
+        hour TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        disaster TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        prob_count INTEGER NOT NULL,
+        prob_sum REAL NOT NULL,
+        prob_max REAL,
+        PRIMARY KEY (hour, event_type, disaster)
+    )
+    ''')
+    ddl("CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)")
+    # alert indexes for the paginated/filtered alert views (newest first)
+    ddl("CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts (timestamp)")
+    ddl("CREATE INDEX IF NOT EXISTS idx_alerts_handled_timestamp ON alerts (handled, timestamp)")
+    ddl("CREATE INDEX IF NOT EXISTS idx_alerts_disaster_timestamp ON alerts (disaster, timestamp)")
 
 if __name__ == "__main__":
     init_db()
-    print("DB initialized at:", DB_PATH)
+    print("DB initialized at:", storage.database_url(DB_PATH).split("@")[-1])
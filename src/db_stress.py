@@ -0,0 +1,182 @@
+# Concurrency stress test for the storage layer.
+#
+# N threads hammer one local SQLite file with the app's mix of operations
+# (alert/log inserts, paged alert reads, marking alerts handled) and the
+# script reports throughput, latency per operation and every error, e.g.
+# "database is locked". Two modes run against separate temporary databases:
+#   pooled  utils_db through storage.py (pooled engine, WAL, busy timeout)
+#   raw     a new sqlite3.connect() per operation on a rollback-journal file,
+#           as utils_db did before storage.py
+# Afterwards the row counts are checked against the writes that succeeded.
+# The exit code is 1 if the pooled mode had any errors or lost writes.
+#
+#   python src/db_stress.py --threads 16 --ops 500
+#   python src/db_stress.py --threads 32 --mode pooled --busy-timeout-ms 10000
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+import storage
+import db_init
+import utils_db
+
+OPS = ("add_alert", "log_event", "list_alerts_page", "mark_alerts_handled")
+
+
+def _pooled_ops():
+    return {
+        "add_alert": lambda rng: utils_db.add_alert("flood", rng.random(), "stress"),
+        "log_event": lambda rng: utils_db.log_event("prediction", f"flood prob={rng.random()}"),
+        "list_alerts_page": lambda rng: utils_db.list_alerts_page(limit=20, handled=False),
+        "mark_alerts_handled": lambda rng: utils_db.mark_alerts_handled(ids=[rng.randint(1, 500)]),
+    }
+
+
+def _raw_ops(db_path, timeout):
+    def run(sql, params, fetch=False):
+        conn = sqlite3.connect(db_path, timeout=timeout)
+        try:
+            rows = conn.execute(sql, params).fetchall() if fetch else conn.execute(sql, params)
+            conn.commit()
+            return rows
+        finally:
+            conn.close()
+
+    return {
+        "add_alert": lambda rng: run("INSERT INTO alerts (disaster, probability, message) VALUES (?,?,?)",
+                                     ("flood", rng.random(), "stress")),
+        "log_event": lambda rng: run("INSERT INTO logs (event_type, details) VALUES (?,?)",
+                                     ("prediction", f"flood prob={rng.random()}")),
+        "list_alerts_page": lambda rng: run("SELECT * FROM alerts WHERE handled=0 "
+                                            "ORDER BY timestamp DESC, id DESC LIMIT 21", (), fetch=True),
+        "mark_alerts_handled": lambda rng: run("UPDATE alerts SET handled=1 WHERE id=?", (rng.randint(1, 500),)),
+    }
+
+
+def _count(db_path, table):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run_mode(mode, db_path, threads, ops_per_thread, write_ratio, raw_timeout):
+    utils_db.DB_PATH = db_init.DB_PATH = db_path
+    db_init.init_db()
+    if mode == "raw":
+        storage.dispose()  # release the pooled connections init_db used
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        ops = _raw_ops(db_path, raw_timeout)
+    else:
+        ops = _pooled_ops()
+    alerts_before, logs_before = _count(db_path, "alerts"), _count(db_path, "logs")
+
+    latencies = defaultdict(list)
+    errors = Counter()
+    succeeded = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local_lat, local_err, local_ok = defaultdict(list), Counter(), Counter()
+        barrier.wait()
+        for _ in range(ops_per_thread):
+            if rng.random() < write_ratio:
+                op = rng.choice(("add_alert", "log_event", "mark_alerts_handled"))
+            else:
+                op = "list_alerts_page"
+            start = time.perf_counter()
+            try:
+                ops[op](rng)
+                local_ok[op] += 1
+            except Exception as e:
+                local_err[f"{op}: {type(e).__name__}: {str(e).splitlines()[0][:80]}"] += 1
+            local_lat[op].append(time.perf_counter() - start)
+        with lock:
+            for op, samples in local_lat.items():
+                latencies[op].extend(samples)
+            errors.update(local_err)
+            succeeded.update(local_ok)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    lost = {"alerts": alerts_before + succeeded["add_alert"] - _count(db_path, "alerts"),
+            "logs": logs_before + succeeded["log_event"] - _count(db_path, "logs")}
+    total = threads * ops_per_thread
+    return {
+        "mode": mode,
+        "ops": total,
+        "seconds": elapsed,
+        "ops_per_s": total / elapsed if elapsed > 0 else 0.0,
+        "errors": dict(errors),
+        "lost_writes": {k: v for k, v in lost.items() if v},
+        "latency_ms": {op: (float(np.percentile(s, 50) * 1000), float(np.percentile(s, 99) * 1000))
+                       for op, s in latencies.items()},
+        "pool": storage.pool_stats() if mode == "pooled" else None,
+    }
+
+
+def report(res):
+    print(f"\n[{res['mode']}] {res['ops']} ops in {res['seconds']:.2f}s — {res['ops_per_s']:.0f} ops/s, "
+          f"{sum(res['errors'].values())} errors")
+    print(f"  {'operation':<22}{'p50 ms':>10}{'p99 ms':>10}")
+    for op in OPS:
+        if op in res["latency_ms"]:
+            p50, p99 = res["latency_ms"][op]
+            print(f"  {op:<22}{p50:>10.2f}{p99:>10.2f}")
+    for msg, n in sorted(res["errors"].items(), key=lambda kv: -kv[1]):
+        print(f"  {n:6d} x {msg}")
+    if res["lost_writes"]:
+        print(f"  lost writes: {res['lost_writes']}")
+    if res["pool"]:
+        print(f"  pool: {next(iter(res['pool'].values()), '')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-access stress test of the database layer.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=300, help="operations per thread")
+    parser.add_argument("--write-ratio", type=float, default=0.5, help="fraction of operations that write")
+    parser.add_argument("--mode", choices=["pooled", "raw", "both"], default="both")
+    parser.add_argument("--raw-timeout", type=float, default=5.0,
+                        help="sqlite3.connect timeout (s) in raw mode; 5 is the sqlite3 default")
+    parser.add_argument("--busy-timeout-ms", type=int, default=None, help="override DB_BUSY_TIMEOUT_MS")
+    args = parser.parse_args()
+    if args.busy_timeout_ms is not None:
+        storage.DB_BUSY_TIMEOUT_MS = args.busy_timeout_ms
+    if storage.DATABASE_URL:
+        parser.error("unset DATABASE_URL: the stress test runs against local SQLite files")
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="db_stress_") as tmp:
+        modes = ["raw", "pooled"] if args.mode == "both" else [args.mode]
+        for mode in modes:
+            res = run_mode(mode, os.path.join(tmp, f"{mode}.db"), args.threads, args.ops,
+                           args.write_ratio, args.raw_timeout)
+            report(res)
+            if mode == "pooled" and (res["errors"] or res["lost_writes"]):
+                failed = True
+        storage.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# Compile a fitted RandomForestClassifier into flat NumPy arrays and score rows
+# by traversing all trees at once, without sklearn's per-call validation,
+# joblib dispatch and per-tree Python overhead.
+#
+#   python src/forest_compiler.py flood        # verify + latency/throughput comparison
+import os
+import json
+import shutil
+import time
+import uuid
+import argparse
+import warnings
+import numpy as np
+
+from model_utils import MODELS_DIR, REGISTRY, load_model, model_version
+
+ARRAYS = ("feature", "threshold", "children", "value", "roots")
+
+
+class CompiledForest:
+    """
+    All nodes of all trees in contiguous arrays: feature and threshold per node,
+    children[:, 0/1] = global index of the left/right child, and value = the
+    per-node class probabilities sklearn's trees return. Leaves point to
+    themselves (threshold +inf), so every (row, tree) pair can be stepped down
+    together; pairs that reached a leaf are dropped from the active set every
+    few steps.
+    """
+
+    compact_every = 4
+
+    def __init__(self, feature, threshold, children, value, roots,
+                 classes, n_features, max_depth, build_id=None, source_sha256=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = int(n_features)
+        self.max_depth = int(max_depth)
+        self.build_id = build_id or uuid.uuid4().hex
+        # sha256 of the model artifact this forest was exported from (see export_compiled)
+        self.source_sha256 = source_sha256
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        feature, threshold, children, value, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for est in model.estimators_:
+            t = est.tree_
+            n = t.node_count
+            is_leaf = (t.children_left == -1)[:, np.newaxis]
+            own = np.arange(offset, offset + n)[:, np.newaxis]
+            feature.append(np.where(is_leaf[:, 0], 0, t.feature))
+            threshold.append(np.where(is_leaf[:, 0], np.inf, t.threshold))
+            children.append(np.where(is_leaf, own,
+                                     np.stack([t.children_left, t.children_right], axis=1) + offset))
+            # same normalisation as DecisionTreeClassifier.predict_proba
+            v = t.value[:, 0, :].copy()
+            normalizer = v.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value.append(v / normalizer)
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, t.max_depth)
+
+        return cls(
+            feature=np.concatenate(feature).astype(np.int32),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            children=np.ascontiguousarray(np.concatenate(children), dtype=np.int32),
+            value=np.concatenate(value).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            classes=model.classes_,
+            n_features=model.n_features_in_,
+            max_depth=max_depth,
+        )
+
+    def _leaves(self, X32):
+        """Leaf node index for every (row, tree) pair, shape (n_rows, n_trees)."""
+        n_rows, n_trees = len(X32), len(self.roots)
+        x_flat = X32.ravel()
+        children_flat = self.children.reshape(-1)
+        node = np.tile(self.roots.astype(np.int64), n_rows)
+        row = np.repeat(np.arange(n_rows, dtype=np.int64) * self.n_features_in_, n_trees)
+        leaves = np.empty_like(node)
+        active = np.arange(len(node))
+        while active.size:
+            for _ in range(self.compact_every):
+                # sklearn compares float32 inputs against float64 thresholds
+                go_right = x_flat[row + self.feature[node]] > self.threshold[node]
+                node = children_flat[2 * node + go_right]
+            done = children_flat[2 * node] == node
+            leaves[active[done]] = node[done]
+            keep = ~done
+            active, node, row = active[keep], node[keep], row[keep]
+        return leaves.reshape(n_rows, n_trees)
+
+    def predict_proba(self, X, chunk_size: int = 16384):
+        X32 = np.ascontiguousarray(X, dtype=np.float32)
+        if X32.ndim != 2 or X32.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has shape {X32.shape}, expected (n, {self.n_features_in_})")
+        # like sklearn's check_array: NaN would silently go left at every split
+        if not np.isfinite(X32).all():
+            raise ValueError("Input X contains NaN or infinity")
+        out = np.zeros((len(X32), self.value.shape[1]), dtype=np.float64)
+        n_trees = len(self.roots)
+        for start in range(0, len(X32), chunk_size):
+            leaves = self._leaves(X32[start:start + chunk_size])
+            acc = out[start:start + chunk_size]
+            # accumulate tree by tree, like sklearn's _accumulate_prediction
+            for t in range(n_trees):
+                acc += self.value[leaves[:, t]]
+        out /= n_trees
+        return out
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    # -- persistence ------------------------------------------------------
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "forest.json"), "w") as f:
+            json.dump({
+                "classes": self.classes_.tolist(),
+                "n_features": self.n_features_in_,
+                "max_depth": self.max_depth,
+                "build_id": self.build_id,
+                "source_sha256": self.source_sha256,
+            }, f)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode=None):
+        with open(os.path.join(path, "forest.json")) as f:
+            info = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ARRAYS}
+        return cls(classes=info["classes"], n_features=info["n_features"],
+                   max_depth=info["max_depth"], build_id=info.get("build_id"),
+                   source_sha256=info.get("source_sha256"), **arrays)
+
+
+def is_compilable(model) -> bool:
+    return hasattr(model, "estimators_") and all(hasattr(e, "tree_") for e in model.estimators_)
+
+
+def _compiled_dir(name: str) -> str:
+    return os.path.join(MODELS_DIR, f"{name}_compiled")
+
+
+def remove_compiled(name: str):
+    path = _compiled_dir(name)
+    shutil.rmtree(path, ignore_errors=True)
+    REGISTRY.invalidate(os.path.join(path, "forest.json"))
+
+
+def export_compiled(name: str, model, source_sha256: str):
+    """
+    Write models/<name>_compiled/ for a fitted forest, tagged with the sha256 of
+    the artifact it came from; for other model types remove a stale one.
+    Called by model_utils.save_model.
+    """
+    if not is_compilable(model):
+        remove_compiled(name)
+        return None
+    path = _compiled_dir(name)
+    compiled = CompiledForest.from_sklearn(model)
+    compiled.source_sha256 = source_sha256
+    # build next to the old copy and swap, so readers never see half-written arrays
+    tmp = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    compiled.save(tmp)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    REGISTRY.mark_stale(os.path.join(path, "forest.json"))
+    return path
+
+
+def load_compiled(name: str, source_sha256: str):
+    """
+    Compiled forest for `name` from the shared model registry, or None if it
+    was not exported from the artifact with this sha256 (missing or stale).
+    """
+    path = _compiled_dir(name)
+    compiled = REGISTRY.get(os.path.join(path, "forest.json"), lambda _: CompiledForest.load(path),
+                            size_of=lambda forest: forest.nbytes)
+    if compiled is None or source_sha256 is None or compiled.source_sha256 != source_sha256:
+        return None
+    return compiled
+
+
+def _bench(fn, X, repeat):
+    fn(X)  # warm-up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(X)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sklearn and compiled forest inference.")
+    parser.add_argument("disaster")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--export", action="store_true",
+                        help="(re-)export models/<disaster>_compiled/ from the current pickled model")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    model_meta = load_model(args.disaster)
+    if not model_meta:
+        raise SystemExit(f"Model for {args.disaster} not found. Train models first.")
+    model = model_meta[0]
+    if not is_compilable(model):
+        raise SystemExit(f"{args.disaster}: {type(model).__name__} is not a pickled sklearn forest")
+    if args.export:
+        print(f"Exported {export_compiled(args.disaster, model, model_version(args.disaster))}")
+    compiled = CompiledForest.from_sklearn(model)
+
+    rng = np.random.default_rng(0)
+    n_features = model.n_features_in_
+    print(f"{args.disaster}: {len(compiled.roots)} trees, {len(compiled.feature)} nodes, depth {compiled.max_depth}")
+    print(f"{'batch':>8}{'sklearn ms':>14}{'compiled ms':>14}{'speedup':>10}{'compiled rows/s':>18}  exact")
+    for batch in (1, 100, 100_000):
+        X = rng.normal(size=(batch, n_features)) * 100
+        exact = np.array_equal(model.predict_proba(X), compiled.predict_proba(X))
+        repeat = max(1, args.repeat // (10 if batch >= 100_000 else 1))
+        t_sk = _bench(model.predict_proba, X, repeat)
+        t_c = _bench(compiled.predict_proba, X, repeat)
+        print(f"{batch:>8}{1000 * t_sk:>14.3f}{1000 * t_c:>14.3f}{t_sk / t_c:>9.1f}x{batch / t_c:>18.0f}  {exact}")
+
+    # both backends must reject the same non-finite input
+    for bad in (np.nan, np.inf, -np.inf):
+        X = rng.normal(size=(3, n_features))
+        X[1, 0] = bad
+        rejected = []
+        for fn in (model.predict_proba, compiled.predict_proba):
+            try:
+                fn(X)
+                rejected.append(False)
+            except ValueError:
+                rejected.append(True)
+        print(f"{str(bad):>8}  rejected by sklearn={rejected[0]} compiled={rejected[1]}  "
+              f"{'ok' if all(rejected) else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# Local streaming ingestion service for sensor readings.
+#
+# Clients send newline-delimited JSON over TCP, one reading per line:
+#   {"disaster": "flood", "features": {"rainfall_mm": 180.2, ...}, "id": "st-17/0042", "location": "st-17"}
+# and get one JSON line back per reading, in order:
+#   {"id": "st-17/0042", "disaster": "flood", "probability": 0.71, "alert": true}
+#
+# Readings are grouped per disaster into micro-batches (at most --max-batch
+# readings or --max-delay-ms of waiting) and scored with predictors.predict_batch,
+# which applies THRESHOLDS and writes the batch's alerts/logs in one transaction.
+# The optional "location" keys alert storm suppression (alert_suppression.py).
+# Readings whose "features" is not an object of finite numbers get an error
+# line back instead of being scored. Each disaster queue is bounded; when it is full the connection stops being
+# read, so TCP flow control pushes back on the sender.
+#
+#   python src/ingest_server.py serve --port 8765
+#   python src/ingest_server.py loadtest --port 8765 --readings 50000 --connections 8
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from predictors import predict_batch, warm_up, THRESHOLDS
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def _validate_features(features) -> dict:
+    """features must be an object of finite numbers; anything else is rejected, not scored as zeros."""
+    if not isinstance(features, dict):
+        raise ValueError(f"features must be an object of numbers, got {type(features).__name__}")
+    for name, value in features.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"feature {name!r} must be a finite number, got {value!r}")
+    return features
+
+
+def _percentiles(values):
+    if not values:
+        return 0.0, 0.0
+    arr = np.fromiter(values, dtype=float)
+    return float(np.percentile(arr, 50)), float(np.percentile(arr, 99))
+
+
+class IngestServer:
+    def __init__(self, host="127.0.0.1", port=8765, max_batch=256, max_delay_ms=20,
+                 queue_size=1000, record=True):
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.record = record
+        self.queues = {d: asyncio.Queue(maxsize=queue_size) for d in THRESHOLDS}
+        self.scored = 0
+        self.alerts = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=20000)  # seconds, receive -> scored
+        self._window_start = time.perf_counter()
+        self._window_count = 0
+
+    # -- scoring --------------------------------------------------------
+    async def _batcher(self, disaster):
+        queue = self.queues[disaster]
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # a failure anywhere here fails this batch's readings, never the batcher task
+            try:
+                frame = pd.DataFrame.from_records([features for _, features, _, _ in batch])
+                locations = [location for _, _, location, _ in batch]
+                res = await loop.run_in_executor(None, predict_batch, disaster, frame, self.record, locations)
+            except Exception as e:
+                for _, _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (received, _, _, fut), p, a in zip(batch, res["probability"], res["alert"]):
+                self.latencies.append(done - received)
+                if not fut.done():
+                    fut.set_result((float(p), bool(a)))
+            self.scored += len(batch)
+            self.alerts += int(res["alert"].sum())
+            self.batches += 1
+            self._window_count += len(batch)
+
+    # -- connections ----------------------------------------------------
+    async def _handle(self, reader, writer):
+        pending = asyncio.Queue()
+        responder = asyncio.create_task(self._respond(pending, writer))
+        loop = asyncio.get_running_loop()
+        try:
+            async for line in reader:
+                received = time.perf_counter()
+                fut = loop.create_future()
+                msg = None
+                try:
+                    msg = json.loads(line)
+                    if not isinstance(msg, dict):
+                        raise ValueError("reading must be a JSON object")
+                    disaster = msg["disaster"]
+                    if disaster not in self.queues:
+                        raise ValueError(f"unknown disaster {disaster!r}")
+                    features = _validate_features(msg["features"])
+                except (ValueError, KeyError, TypeError) as e:
+                    fut.set_exception(ValueError(f"missing {e}" if isinstance(e, KeyError) else str(e)))
+                    await pending.put((msg.get("id") if isinstance(msg, dict) else None, None, fut))
+                    continue
+                await pending.put((msg.get("id"), disaster, fut))
+                # blocks while the disaster queue is full (backpressure)
+                await self.queues[disaster].put((received, features, msg.get("location"), fut))
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+
+    async def _respond(self, pending, writer):
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            reading_id, disaster, fut = item
+            try:
+                prob, alert = await fut
+                out = {"id": reading_id, "disaster": disaster, "probability": prob, "alert": alert}
+            except Exception as e:
+                out = {"id": reading_id, "error": str(e)}
+            writer.write((json.dumps(out) + "\n").encode())
+            await writer.drain()
+
+    # -- reporting ------------------------------------------------------
+    def stats(self):
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        rate = self._window_count / elapsed if elapsed > 0 else 0.0
+        self._window_start, self._window_count = now, 0
+        p50, p99 = _percentiles(self.latencies)
+        return {"readings_per_s": rate, "scored": self.scored, "alerts": self.alerts,
+                "batches": self.batches, "p50_ms": 1000 * p50, "p99_ms": 1000 * p99,
+                "queued": {d: q.qsize() for d, q in self.queues.items() if q.qsize()}}
+
+    async def _report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            s = self.stats()
+            if s["readings_per_s"] or s["queued"]:
+                print(f"{s['readings_per_s']:.0f} readings/s  p50 {s['p50_ms']:.1f} ms  "
+                      f"p99 {s['p99_ms']:.1f} ms  scored {s['scored']}  alerts {s['alerts']}  "
+                      f"queued {s['queued']}")
+
+    async def serve(self, report_interval=5.0):
+        batchers = [asyncio.create_task(self._batcher(d)) for d in self.queues]
+        reporter = asyncio.create_task(self._report(report_interval))
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=1 << 20)
+        print(f"Ingesting on {self.host}:{self.port} (max batch {self.max_batch}, "
+              f"max delay {1000 * self.max_delay:.0f} ms)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for t in batchers + [reporter]:
+                t.cancel()
+
+
+# -- synthetic sensor generator ---------------------------------------------
+def _synthetic_readings(disasters, n, seed=0):
+    """Readings drawn from the bundled data/<disaster>_dataset.csv rows."""
+    rng = random.Random(seed)
+    pools = {}
+    for d in disasters:
+        path = os.path.join(DATA_DIR, f"{d}_dataset.csv")
+        if os.path.exists(path):
+            pools[d] = pd.read_csv(path).drop(columns=["label"], errors="ignore").to_dict("records")
+    if not pools:
+        raise SystemExit("No datasets found in data/ to generate readings from.")
+    names = sorted(pools)
+    for i in range(n):
+        d = rng.choice(names)
+        yield {"id": i, "disaster": d, "features": rng.choice(pools[d])}
+
+
+async def load_test(host, port, readings=10000, connections=4, rate=0.0, disasters=None):
+    disasters = disasters or sorted(THRESHOLDS)
+    per_conn = readings // connections
+    latencies = []
+    errors = 0
+
+    async def client(cid):
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+        sent_at = {}
+
+        async def send():
+            interval = connections / rate if rate else 0.0
+            for msg in _synthetic_readings(disasters, per_conn, seed=cid):
+                sent_at[msg["id"]] = time.perf_counter()
+                writer.write((json.dumps(msg) + "\n").encode())
+                await writer.drain()
+                if interval:
+                    await asyncio.sleep(interval)
+
+        sender = asyncio.create_task(send())
+        for _ in range(per_conn):
+            out = json.loads(await reader.readline())
+            if "error" in out:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - sent_at.pop(out["id"]))
+        await sender
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(connections)))
+    elapsed = time.perf_counter() - start
+    p50, p99 = _percentiles(latencies)
+    total = per_conn * connections
+    print(f"{total} readings over {connections} connections in {elapsed:.2f}s: "
+          f"{total / elapsed:.0f} readings/s, end-to-end p50 {1000 * p50:.1f} ms, "
+          f"p99 {1000 * p99:.1f} ms, errors {errors}")
+    return {"readings_per_s": total / elapsed, "p50_ms": 1000 * p50, "p99_ms": 1000 * p99,
+            "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming sensor ingestion service.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="run the ingestion server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--max-batch", type=int, default=256)
+    serve.add_argument("--max-delay-ms", type=float, default=20)
+    serve.add_argument("--queue-size", type=int, default=1000)
+    serve.add_argument("--no-record", action="store_true", help="don't write alerts/logs")
+    serve.add_argument("--report-interval", type=float, default=5.0)
+
+    load = sub.add_parser("loadtest", help="send synthetic sensor readings to a running server")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=8765)
+    load.add_argument("--readings", type=int, default=10000)
+    load.add_argument("--connections", type=int, default=4)
+    load.add_argument("--rate", type=float, default=0.0, help="readings/s in total (0 = as fast as possible)")
+    load.add_argument("--disasters", nargs="*", choices=sorted(THRESHOLDS))
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        warm_up(background=False)
+        server = IngestServer(args.host, args.port, max_batch=args.max_batch,
+                              max_delay_ms=args.max_delay_ms, queue_size=args.queue_size,
+                              record=not args.no_record)
+        try:
+            asyncio.run(server.serve(report_interval=args.report_interval))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(load_test(args.host, args.port, readings=args.readings,
+                              connections=args.connections, rate=args.rate,
+                              disasters=args.disasters))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# Lightweight timing instrumentation with Prometheus text export.
+#
+# Disabled by default: a @timed function then costs one flag check per call
+# and `with timer(...)` returns a shared no-op context. Enable with
+# METRICS_ENABLED=1 or metrics.enable().
+#
+# Export:
+#   METRICS_PORT=9108       serve http://127.0.0.1:9108/metrics (started by app.py)
+#   write_prometheus(path)  write the same text for a node-exporter textfile collector
+import os
+import time
+import bisect
+import threading
+from functools import wraps
+
+ENABLED = os.environ.get("METRICS_ENABLED") == "1"
+
+# histogram bucket upper bounds, seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_histograms = {}  # (op, labels) -> {buckets (last is +Inf), sum, count}
+_counters = {}    # (name, labels) -> value
+_server = None
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def observe(op: str, seconds: float, **labels):
+    if not ENABLED:
+        return
+    key = _key(op, labels)
+    i = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0}
+        h["buckets"][i] += 1
+        h["sum"] += seconds
+        h["count"] += 1
+
+
+def inc(name: str, value: float = 1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Timer:
+    __slots__ = ("op", "labels", "start")
+
+    def __init__(self, op, labels):
+        self.op = op
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.op, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+def timer(op: str, **labels):
+    """Context manager timing a block into the `op` histogram."""
+    return _Timer(op, labels) if ENABLED else _NOOP
+
+
+def timed(op: str):
+    """Decorator timing every call of a function into the `op` histogram."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(op, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# -- export -----------------------------------------------------------------
+def _fmt_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    with _lock:
+        hists = {k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]}
+                 for k, v in _histograms.items()}
+        counters = dict(_counters)
+
+    if hists:
+        lines.append("# HELP disaster_operation_seconds Latency of instrumented operations.")
+        lines.append("# TYPE disaster_operation_seconds histogram")
+        for (op, labels), h in sorted(hists.items()):
+            base = (("op", op),) + labels
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float("inf"),), h["buckets"]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"disaster_operation_seconds_bucket{_fmt_labels(base, {'le': le})} {cumulative}")
+            lines.append(f"disaster_operation_seconds_sum{_fmt_labels(base)} {h['sum']}")
+            lines.append(f"disaster_operation_seconds_count{_fmt_labels(base)} {h['count']}")
+
+    for name in sorted({k[0] for k in counters}):
+        lines.append(f"# TYPE disaster_{name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"disaster_{name}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+def start_http_server(port: int, host: str = "127.0.0.1"):
+    """Serve /metrics from a daemon thread (idempotent per process)."""
+    global _server
+    if _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
+
+
+def _quantile(buckets, count, q):
+    # upper bound of the bucket containing the q-th observation
+    target = q * count
+    cumulative = 0
+    for bound, n in zip(BUCKETS + (float("inf"),), buckets):
+        cumulative += n
+        if cumulative >= target:
+            return bound
+    return float("inf")
+
+
+def snapshot() -> list:
+    """One row per operation for display: count, mean and bucketed p50/p99 (ms)."""
+    with _lock:
+        items = [(k, list(v["buckets"]), v["sum"], v["count"]) for k, v in _histograms.items()]
+    rows = []
+    for (op, labels), buckets, total, count in sorted(items):
+        rows.append({
+            "operation": op + _fmt_labels(labels),
+            "count": count,
+            "mean_ms": 1000 * total / count if count else 0.0,
+            "p50_ms<=": 1000 * _quantile(buckets, count, 0.5),
+            "p99_ms<=": 1000 * _quantile(buckets, count, 0.99),
+            "total_s": total,
+        })
+    return rows
+
+
+def counters() -> dict:
+    with _lock:
+        return {k[0] + _fmt_labels(k[1]): v for k, v in _counters.items()}
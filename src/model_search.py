@@ -0,0 +1,116 @@
+# Hyperparameter search strategies for train_models.train_generic.
+#
+# grid     exhaustive GridSearchCV (5-fold, every candidate at full size)
+# halving  successive halving: candidates are first scored on a small sample
+#          with a small forest; the best 1/factor move on to a larger sample
+#          and more trees, until one remains and is refit on the full data
+# oob      one forest grown with warm_start until the out-of-bag AUC plateaus
+#
+# Every strategy returns (fitted_model, info) where info records the number of
+# forests fitted and the chosen parameters.
+import math
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import roc_auc_score, make_scorer
+from sklearn.model_selection import (GridSearchCV, ParameterGrid, StratifiedKFold,
+                                     cross_val_score, train_test_split)
+
+
+def grid_search(base, X_train, y_train, param_grid, cv=5):
+    # Optimize for AUC
+    auc_scorer = make_scorer(roc_auc_score, needs_proba=True)
+
+    clf = GridSearchCV(
+        base,
+        param_grid,
+        cv=StratifiedKFold(n_splits=cv),
+        scoring=auc_scorer,
+        n_jobs=-1
+    )
+    clf.fit(X_train, y_train)
+    n_candidates = len(clf.cv_results_["params"])
+    return clf.best_estimator_, {"fits": n_candidates * cv + 1, "best_params": clf.best_params_,
+                                 "cv_auc": float(clf.best_score_)}
+
+
+def _subsample(X, y, n, random_state):
+    if n >= len(X):
+        return X, y
+    try:
+        X_s, _, y_s, _ = train_test_split(X, y, train_size=n, random_state=random_state, stratify=y)
+    except ValueError:
+        X_s, _, y_s, _ = train_test_split(X, y, train_size=n, random_state=random_state)
+    return X_s, y_s
+
+
+def halving_search(base, X_train, y_train, param_grid, factor=3, cv=3,
+                   min_samples=200, min_estimators=10, random_state=42):
+    candidates = list(ParameterGrid(param_grid))
+    n_rounds = max(1, math.ceil(math.log(len(candidates), factor)))
+    fits = 0
+    scores = []
+
+    for r in range(n_rounds):
+        # both the sample count and n_estimators grow by `factor` each round
+        frac = float(factor) ** (r - (n_rounds - 1))
+        n_samples = max(min_samples, int(frac * len(X_train)))
+        X_r, y_r = _subsample(X_train, y_train, n_samples, random_state)
+
+        scores = []
+        for params in candidates:
+            scaled = dict(params)
+            if "n_estimators" in scaled:
+                scaled["n_estimators"] = max(min_estimators, int(round(scaled["n_estimators"] * frac)))
+            est = clone(base).set_params(**scaled)
+            cv_scores = cross_val_score(est, X_r, y_r, cv=StratifiedKFold(n_splits=cv),
+                                        scoring="roc_auc", error_score=np.nan)
+            fits += cv
+            scores.append(np.nanmean(cv_scores) if not np.isnan(cv_scores).all() else -np.inf)
+
+        keep = max(1, math.ceil(len(candidates) / factor))
+        order = np.argsort(-np.asarray(scores), kind="stable")[:keep]
+        candidates = [candidates[i] for i in order]
+        scores = [scores[i] for i in order]
+        if len(candidates) == 1:
+            break
+
+    best_params = candidates[0]
+    model = clone(base).set_params(**best_params).fit(X_train, y_train)
+    return model, {"fits": fits + 1, "best_params": best_params,
+                   "cv_auc": float(scores[0]) if np.isfinite(scores[0]) else None}
+
+
+def oob_early_stopping(base, X_train, y_train, params=None, step=25, max_estimators=500,
+                       patience=2, tol=1e-3):
+    model = clone(base).set_params(warm_start=True, oob_score=True, bootstrap=True,
+                                   n_estimators=0, **(params or {}))
+    best_auc, best_n, stale = -np.inf, step, 0
+    history = []
+
+    while model.n_estimators < max_estimators:
+        model.set_params(n_estimators=model.n_estimators + step)
+        model.fit(X_train, y_train)
+        oob = model.oob_decision_function_
+        if oob.shape[1] < 2:
+            break  # single class: nothing to optimise
+        seen = np.isfinite(oob[:, 1])
+        auc = roc_auc_score(np.asarray(y_train)[seen], oob[seen, 1])
+        history.append((model.n_estimators, auc))
+        if auc > best_auc + tol:
+            best_auc, best_n, stale = auc, model.n_estimators, 0
+        else:
+            stale += 1
+            if stale >= patience:
+                break
+
+    model.set_params(warm_start=False)
+    return model, {"fits": len(history) or 1, "best_params": {"n_estimators": model.n_estimators},
+                   "cv_auc": float(best_auc) if np.isfinite(best_auc) else None,
+                   "plateau_at": best_n, "oob_history": history}
+
+
+SEARCH_STRATEGIES = {
+    "grid": grid_search,
+    "halving": halving_search,
+    "oob": oob_early_stopping,
+}
@@ -1,20 +1,282 @@
 # Utilities for saving/loading sklearn models and columns
 import pickle
 import os
+import json
+import argparse
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import timed
 
 BASE_DIR = os.path.join(os.path.dirname(__file__), "..")
 MODELS_DIR = os.path.join(BASE_DIR, "models")
 os.makedirs(MODELS_DIR, exist_ok=True)
 
-def save_model(name: str, model, meta: dict = None):
-    path = os.path.join(MODELS_DIR, f"{name}_model.pkl")
-    with open(path, "wb") as f:
-        pickle.dump({"model": model, "meta": meta or {}}, f)
+# Memory cap for the in-process model registry (bytes, estimated from artifact size)
+MODEL_CACHE_MAX_BYTES = int(os.environ.get("MODEL_CACHE_MAX_BYTES", 512 * 1024 * 1024))
 
-def load_model(name: str):
-    path = os.path.join(MODELS_DIR, f"{name}_model.pkl")
-    if not os.path.exists(path):
-        return None
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models shared by all sessions and threads.
+    Entries are reloaded when the artifact's mtime and content hash change,
+    and evicted least-recently-used first once max_bytes is exceeded. An
+    entry's size is the artifact file's size unless get() is given size_of,
+    e.g. for directory formats whose arrays live next to the tracked file.
+    """
+
+    def __init__(self, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # path -> dict(value, mtime, size, file_size, sha256)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def get(self, path: str, loader, size_of=None):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry["mtime"] == st.st_mtime_ns and entry["file_size"] == st.st_size:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry["value"]
+
+            sha = file_sha256(path)
+            if entry is not None and entry["sha256"] == sha:
+                # touched but unchanged (e.g. copied over with the same bytes)
+                entry["mtime"] = st.st_mtime_ns
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry["value"]
+
+            value = loader(path)
+            if entry is not None:
+                self.reloads += 1
+            else:
+                self.misses += 1
+            self._entries[path] = {
+                "value": value,
+                "mtime": st.st_mtime_ns,
+                "size": size_of(value) if size_of else st.st_size,
+                "file_size": st.st_size,
+                "sha256": sha,
+            }
+            self._entries.move_to_end(path)
+            self._evict()
+            return value
+
+    def _evict(self):
+        # always keep the most recently used entry, even if it alone exceeds the cap
+        while len(self._entries) > 1 and self.total_bytes() > self.max_bytes:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def total_bytes(self) -> int:
+        return sum(e["size"] for e in self._entries.values())
+
+    def version(self, path: str):
+        with self._lock:
+            entry = self._entries.get(path)
+            return entry["sha256"] if entry else None
+
+    def mark_stale(self, path: str):
+        # force a re-check on next access; counted as a reload if the content changed
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                entry["mtime"] = None
+
+    def invalidate(self, path: str = None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes(),
+                "max_bytes": self.max_bytes,
+            }
+
+
+REGISTRY = ModelRegistry()
+
+
+def _model_path(name: str) -> str:
+    return os.path.join(MODELS_DIR, f"{name}_model.pkl")
+
+
+def _model_dir(name: str) -> str:
+    # memory-mappable format: meta.json + raw .npy tree arrays
+    return os.path.join(MODELS_DIR, f"{name}_model")
+
+
+def _artifact_path(name: str) -> str:
+    """File whose mtime/hash identifies the current artifact (mmap directory wins over .pkl)."""
+    meta_path = os.path.join(_model_dir(name), "meta.json")
+    return meta_path if os.path.exists(meta_path) else _model_path(name)
+
+
+def _unpickle(path: str):
     with open(path, "rb") as f:
         data = pickle.load(f)
     return data["model"], data.get("meta", {})
+
+
+def _load_mmap(meta_path: str):
+    from forest_compiler import CompiledForest
+    path = os.path.dirname(meta_path)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta.pop("artifact_id", None)
+    # read-only mapping: every process shares the same page-cache pages
+    return CompiledForest.load(path, mmap_mode="r"), meta
+
+
+def _load_artifact(path: str):
+    return _load_mmap(path) if path.endswith("meta.json") else _unpickle(path)
+
+
+def _artifact_nbytes(value) -> int:
+    # mmap artifacts: the tree arrays, not the few-hundred-byte meta.json
+    return value[0].nbytes
+
+
+def _registry_get(path: str):
+    size_of = _artifact_nbytes if path.endswith("meta.json") else None
+    return REGISTRY.get(path, _load_artifact, size_of=size_of)
+
+
+def _json_default(o):
+    if hasattr(o, "tolist"):
+        return o.tolist()
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def _save_mmap(name: str, model, meta: dict):
+    from forest_compiler import CompiledForest, is_compilable
+    if not is_compilable(model):
+        raise ValueError(f"{type(model).__name__} can't be stored in the mmap format (tree ensembles only)")
+    path = _model_dir(name)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    compiled = model if hasattr(model, "build_id") else CompiledForest.from_sklearn(model)
+    compiled.save(tmp)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(dict(meta or {}, artifact_id=compiled.build_id), f, default=_json_default)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+def save_model(name: str, model, meta: dict = None, fmt: str = "pickle"):
+    """
+    fmt="pickle" writes models/<name>_model.pkl; fmt="mmap" writes the
+    models/<name>_model/ directory (tree ensembles only). Saving in one format
+    removes any artifact of the other, so load_model never serves a stale one.
+    A pickled forest is also re-exported to models/<name>_compiled/ (tagged
+    with the pickle's sha256); for anything else that copy is removed.
+    """
+    from forest_compiler import export_compiled, remove_compiled
+    pkl_path = _model_path(name)
+    meta_path = os.path.join(_model_dir(name), "meta.json")
+    if fmt == "mmap":
+        _save_mmap(name, model, meta)
+        if os.path.exists(pkl_path):
+            os.remove(pkl_path)
+        REGISTRY.invalidate(pkl_path)
+        REGISTRY.mark_stale(meta_path)
+        # load_model returns the memory-mapped forest itself
+        remove_compiled(name)
+    else:
+        # write next to the old file and swap, so a reloading session never unpickles half a file
+        tmp = f"{pkl_path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            pickle.dump({"model": model, "meta": meta or {}}, f)
+        os.replace(tmp, pkl_path)
+        shutil.rmtree(_model_dir(name), ignore_errors=True)
+        REGISTRY.invalidate(meta_path)
+        REGISTRY.mark_stale(pkl_path)
+        export_compiled(name, model, source_sha256=file_sha256(pkl_path))
+
+
+@timed("load_model")
+def load_model(name: str):
+    return _registry_get(_artifact_path(name))
+
+
+def model_exists(name: str) -> bool:
+    return os.path.exists(_artifact_path(name))
+
+
+def artifact_sha256(name: str):
+    path = _artifact_path(name)
+    return file_sha256(path) if os.path.exists(path) else None
+
+
+def convert_to_mmap(name: str, keep_pickle: bool = False):
+    """Convert models/<name>_model.pkl to the memory-mappable directory format."""
+    path = _model_path(name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    model, meta = _unpickle(path)
+    out = _save_mmap(name, model, meta)
+    if not keep_pickle:
+        os.remove(path)
+    REGISTRY.invalidate(path)
+    from forest_compiler import remove_compiled
+    remove_compiled(name)
+    return out
+
+
+def model_version(name: str):
+    """Content hash of the currently loaded artifact for `name` (None if not loaded)."""
+    return REGISTRY.version(_artifact_path(name))
+
+
+def registry_stats() -> dict:
+    return REGISTRY.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled models to the memory-mappable format.")
+    parser.add_argument("names", nargs="*", help="models to convert (default: every .pkl in models/)")
+    parser.add_argument("--keep-pickle", action="store_true")
+    args = parser.parse_args()
+
+    names = args.names or sorted(f[:-len("_model.pkl")] for f in os.listdir(MODELS_DIR)
+                                 if f.endswith("_model.pkl"))
+    for n in names:
+        try:
+            print(f"{n}: converted to {convert_to_mmap(n, keep_pickle=args.keep_pickle)}")
+        except (ValueError, FileNotFoundError) as e:
+            print(f"{n}: skipped ({e})")
+
+
+if __name__ == "__main__":
+    main()
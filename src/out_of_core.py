@@ -0,0 +1,243 @@
+# Out-of-core training for datasets larger than memory.
+#
+# The CSV is streamed with pd.read_csv(chunksize=...) and never held in full.
+# A small random holdout (--test-fraction, capped at --max-test-rows) is kept
+# for evaluation, and the training rows are reduced within --memory-mb in one
+# of two ways:
+#   sample  stratified reservoir sample: one reservoir per class of equal
+#           capacity; each kept row is weighted by count/kept so the class
+#           priors of the full data are restored
+#   binned  every feature quantized to --bins quantile bins (edges taken from
+#           the first chunk); identical (bins, label) rows are merged into one
+#           row whose weight is its count
+# A HistGradientBoostingClassifier is fitted on the result and saved through
+# model_utils.save_model, so predictors.predict/predict_batch use it unchanged.
+#
+#   python src/out_of_core.py data/flood_dataset.csv --model-name flood --mode sample --memory-mb 256
+#   python src/train_models.py --out-of-core binned
+import os
+import time
+import argparse
+import resource
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.metrics import accuracy_score, roc_auc_score
+
+from model_utils import save_model
+
+HGB_PARAMS = {"max_iter": 300, "learning_rate": 0.1, "max_leaf_nodes": 31, "early_stopping": True,
+              "validation_fraction": 0.1, "n_iter_no_change": 10, "random_state": 42}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def iter_chunks(csv_path, features, label_col="label", chunksize=200_000):
+    """(X float32, y raw labels) per chunk, rows with missing values dropped."""
+    reader = pd.read_csv(csv_path, usecols=list(features) + [label_col], chunksize=chunksize,
+                         dtype={f: np.float32 for f in features})
+    for chunk in reader:
+        chunk = chunk.dropna()
+        yield chunk[list(features)].to_numpy(dtype=np.float32), chunk[label_col].to_numpy()
+
+
+class _Reservoir:
+    """Algorithm R over row blocks: a uniform sample of `capacity` rows from a stream."""
+
+    def __init__(self, capacity, n_features, rng):
+        self.capacity = capacity
+        self.X = np.empty((capacity, n_features), dtype=np.float32)
+        self.y = np.empty(capacity, dtype=object)
+        self.size = 0
+        self.seen = 0
+        self.rng = rng
+
+    def add(self, X, y):
+        n = len(X)
+        fill = min(n, self.capacity - self.size)
+        if fill:
+            self.X[self.size:self.size + fill] = X[:fill]
+            self.y[self.size:self.size + fill] = y[:fill]
+            self.size += fill
+        if fill < n:
+            # row t (1-based over the stream) replaces a random slot with probability capacity/t
+            t = self.seen + np.arange(fill + 1, n + 1)
+            slots = (self.rng.random(n - fill) * t).astype(np.int64)
+            keep = np.flatnonzero(slots < self.capacity)
+            if len(keep):
+                # when several rows hit one slot the last one wins, as in the sequential algorithm
+                slot_rev, first_rev = np.unique(slots[keep][::-1], return_index=True)
+                rows = fill + keep[::-1][first_rev]
+                self.X[slot_rev] = X[rows]
+                self.y[slot_rev] = y[rows]
+        self.seen += n
+
+    def shrink(self, capacity):
+        if self.size > capacity:
+            idx = self.rng.choice(self.size, capacity, replace=False)
+            self.X, self.y = self.X[idx].copy(), self.y[idx].copy()
+            self.size = capacity
+        else:
+            self.X, self.y = self.X[:capacity].copy(), self.y[:capacity].copy()
+        self.capacity = capacity
+
+    def data(self):
+        return self.X[:self.size], self.y[:self.size]
+
+
+def stratified_sample(chunks, n_features, budget_rows, rng):
+    """Per-class reservoirs sharing budget_rows; returns (X, y_raw, weight)."""
+    reservoirs = {}
+    for X, y in chunks:
+        for label in np.unique(y):
+            if label not in reservoirs:
+                capacity = budget_rows // (len(reservoirs) + 1)
+                for r in reservoirs.values():
+                    r.shrink(capacity)
+                reservoirs[label] = _Reservoir(capacity, n_features, rng)
+            mask = y == label
+            reservoirs[label].add(X[mask], y[mask])
+    Xs, ys, ws = [], [], []
+    for r in reservoirs.values():
+        X, y = r.data()
+        Xs.append(X)
+        ys.append(y)
+        ws.append(np.full(len(X), r.seen / max(len(X), 1), dtype=np.float64))
+    return np.concatenate(Xs), np.concatenate(ys), np.concatenate(ws)
+
+
+def binned_counts(chunks, n_features, n_bins, budget_rows):
+    """Histogram representation; returns (X bin centers, y_raw, weight=count)."""
+    if n_bins > 256 or 8 * (n_features + 1) > 64:
+        raise ValueError("binned mode packs each row into 64 bits: at most 256 bins and 7 features")
+    edges = centers = None
+    labels = {}
+    keys, counts = np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    for X, y in chunks:
+        if edges is None:
+            qs = np.linspace(0, 1, n_bins + 1)
+            edges = [np.unique(np.quantile(X[:, j], qs[1:-1])) for j in range(n_features)]
+            lo, hi = X.min(axis=0), X.max(axis=0)
+            centers = []
+            for j, e in enumerate(edges):
+                bounds = np.concatenate([[lo[j]], e, [hi[j]]])
+                centers.append(((bounds[:-1] + bounds[1:]) / 2).astype(np.float32))
+        packed = np.zeros(len(X), dtype=np.uint64)
+        for j in range(n_features):
+            packed |= np.searchsorted(edges[j], X[:, j], side="right").astype(np.uint64) << np.uint64(8 * j)
+        codes = np.array([labels.setdefault(v, len(labels)) for v in y], dtype=np.uint64)
+        packed |= codes << np.uint64(8 * n_features)
+        k, c = np.unique(packed, return_counts=True)
+        keys, inv = np.unique(np.concatenate([keys, k]), return_inverse=True)
+        counts = np.bincount(inv, weights=np.concatenate([counts, c]), minlength=len(keys)).astype(np.int64)
+        if len(keys) > budget_rows:
+            raise MemoryError(f"{len(keys)} distinct binned rows exceed the {budget_rows}-row budget; "
+                              f"use fewer --bins, a larger --memory-mb or --mode sample")
+    X = np.empty((len(keys), n_features), dtype=np.float32)
+    for j in range(n_features):
+        X[:, j] = centers[j][((keys >> np.uint64(8 * j)) & np.uint64(0xFF)).astype(np.int64)]
+    by_code = np.empty(len(labels), dtype=object)
+    for v, code in labels.items():
+        by_code[code] = v
+    y = by_code[(keys >> np.uint64(8 * n_features)).astype(np.int64)]
+    return X, y, counts.astype(np.float64)
+
+
+def _encode_labels(*ys):
+    # same codes as train_models.load_training_data: 0/1 labels stay, strings -> sorted category codes
+    classes = sorted(set().union(*(set(y.tolist()) for y in ys)))
+    if all(isinstance(c, (int, np.integer, float, np.floating)) for c in classes):
+        return [np.asarray(y, dtype=int) for y in ys]
+    lookup = {c: i for i, c in enumerate(classes)}
+    return [np.array([lookup[v] for v in y], dtype=int) for y in ys]
+
+
+def train_out_of_core(csv_path, features, label_col="label", model_name="model", mode="sample",
+                      memory_mb=256, bins=64, chunksize=200_000, test_fraction=0.05,
+                      max_test_rows=200_000, save=True, lineage=None, seed=42):
+    """Stream csv_path, reduce it within memory_mb, fit HistGradientBoosting and save it; returns a report."""
+    print("\n==============================")
+    print(f" Out-of-core training: {model_name} ({mode})")
+    print("==============================")
+    rng = np.random.default_rng(seed)
+    n_features = len(features)
+    # float32 features + label object pointer + weight, with 2x headroom for fitting copies
+    budget_rows = max(1000, int(memory_mb * 2**20 / (2 * (4 * n_features + 16))))
+    holdout = _Reservoir(max_test_rows, n_features, rng)
+    stats = {"rows": 0}
+
+    def training_chunks():
+        for X, y in iter_chunks(csv_path, features, label_col, chunksize):
+            stats["rows"] += len(X)
+            test = rng.random(len(X)) < test_fraction
+            holdout.add(X[test], y[test])
+            yield X[~test], y[~test]
+
+    start = time.perf_counter()
+    if mode == "sample":
+        X, y_raw, weight = stratified_sample(training_chunks(), n_features, budget_rows, rng)
+    elif mode == "binned":
+        X, y_raw, weight = binned_counts(training_chunks(), n_features, bins, budget_rows)
+    else:
+        raise ValueError(f"unknown mode {mode!r} (sample or binned)")
+    X_test, y_test_raw = holdout.data()
+    y, y_test = _encode_labels(y_raw, y_test_raw)
+    reduce_seconds = time.perf_counter() - start
+    print(f"Streamed {stats['rows']} rows in {reduce_seconds:.1f}s -> {len(X)} training rows "
+          f"(+{len(X_test)} holdout), label counts {dict(zip(*np.unique(y, return_counts=True)))}")
+
+    start = time.perf_counter()
+    model = HistGradientBoostingClassifier(**HGB_PARAMS)
+    model.fit(X, y, sample_weight=weight)
+    fit_seconds = time.perf_counter() - start
+
+    acc = auc = None
+    if len(X_test):
+        acc = accuracy_score(y_test, model.predict(X_test))
+        if len(np.unique(y_test)) > 1 and len(model.classes_) == 2:
+            auc = roc_auc_score(y_test, model.predict_proba(X_test)[:, 1])
+    report = {"mode": mode, "rows": stats["rows"], "train_rows": len(X), "test_rows": len(X_test),
+              "memory_mb": memory_mb, "reduce_seconds": reduce_seconds, "fit_seconds": fit_seconds,
+              "accuracy": acc, "auc": auc, "peak_rss_mb": peak_rss_mb()}
+    print(f"{model_name}: accuracy {acc if acc is None else f'{acc:.2%}'}, "
+          f"AUC {auc if auc is None else f'{auc:.3f}'}, fit {fit_seconds:.1f}s, "
+          f"peak RSS {report['peak_rss_mb']:.0f} MB")
+
+    if save:
+        meta = {"features": list(features), "accuracy": acc, "auc": auc, "search": f"out_of_core:{mode}",
+                "train_seconds": reduce_seconds + fit_seconds, "out_of_core": report, "lineage": lineage}
+        save_model(model_name, model, meta=meta)  # also removes the previous model's compiled forest
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a HistGradientBoosting model from a CSV larger than memory.")
+    parser.add_argument("csv")
+    parser.add_argument("--features", nargs="*", help="default: the features train_models.DATASETS lists for this CSV")
+    parser.add_argument("--label-col", default="label")
+    parser.add_argument("--model-name", required=True)
+    parser.add_argument("--mode", choices=["sample", "binned"], default="sample")
+    parser.add_argument("--memory-mb", type=float, default=256, help="budget for the reduced training set")
+    parser.add_argument("--bins", type=int, default=64, help="quantile bins per feature (binned mode)")
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--test-fraction", type=float, default=0.05)
+    parser.add_argument("--no-save", action="store_true", help="report only")
+    args = parser.parse_args()
+
+    features = args.features
+    if not features:
+        from train_models import DATASETS
+        features = next((f for csv_name, f, _ in DATASETS if csv_name == os.path.basename(args.csv)), None)
+        if not features:
+            parser.error("--features is required for this CSV")
+    train_out_of_core(args.csv, features, label_col=args.label_col, model_name=args.model_name, mode=args.mode,
+                      memory_mb=args.memory_mb, bins=args.bins, chunksize=args.chunksize,
+                      test_fraction=args.test_fraction, save=not args.no_save)
+
+
+if __name__ == "__main__":
+    main()
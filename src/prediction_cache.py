@@ -0,0 +1,95 @@
+# Memo cache for predictors.predict (opt-in: PREDICTION_CACHE=1).
+#
+# Feature vectors are rounded per feature (PREDICTION_CACHE_DECIMALS, default
+# 3 decimals, overridable per feature with e.g.
+# PREDICTION_CACHE_FEATURE_DECIMALS="rainfall_mm=0,wind_speed_kmph=1") and the
+# model is evaluated on the rounded vector, so a probability never depends on
+# which of two near-identical readings arrived first. Entries are keyed by
+# disaster, model content hash and the rounded vector: a retrained model has a
+# new hash, so its old entries are never hit and age out of the LRU.
+import os
+import time
+import threading
+from collections import OrderedDict
+
+PREDICTION_CACHE = os.environ.get("PREDICTION_CACHE") == "1"
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 10000))
+PREDICTION_CACHE_TTL_S = float(os.environ.get("PREDICTION_CACHE_TTL_S", 600))
+PREDICTION_CACHE_DECIMALS = int(os.environ.get("PREDICTION_CACHE_DECIMALS", 3))
+
+
+def _parse_feature_decimals(spec: str) -> dict:
+    out = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        name, _, digits = part.partition("=")
+        out[name.strip()] = int(digits)
+    return out
+
+
+class PredictionCache:
+    """LRU of (disaster, model_version, rounded features) -> probability, bounded by size and TTL."""
+
+    def __init__(self, max_entries: int = PREDICTION_CACHE_SIZE, ttl: float = PREDICTION_CACHE_TTL_S,
+                 decimals: int = PREDICTION_CACHE_DECIMALS, feature_decimals: dict = None,
+                 enabled: bool = PREDICTION_CACHE, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.decimals = decimals
+        self.feature_decimals = dict(feature_decimals if feature_decimals is not None else
+                                     _parse_feature_decimals(os.environ.get("PREDICTION_CACHE_FEATURE_DECIMALS")))
+        self.enabled = enabled
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, probability)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def quantize(self, features: list, values: list) -> tuple:
+        d = self.feature_decimals
+        return tuple(round(float(v), d.get(f, self.decimals)) for f, v in zip(features, values))
+
+    def get(self, key):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, probability: float):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, probability)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+            }
+
+
+CACHE = PredictionCache()
@@ -1,6 +1,12 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from model_utils import load_model
-from utils_db import add_alert, log_event
+from model_utils import load_model, model_version
+from utils_db import add_alert, log_event, record_predictions
+from alert_suppression import SUPPRESSOR
+import metrics
+import prediction_cache
 
 # Thresholds for high probability
 THRESHOLDS = {
@@ -11,21 +17,84 @@ THRESHOLDS = {
     "flood": 0.6,
 }
 
-def predict(disaster: str, features_dict: dict):
+# "sklearn", "compiled" (flat-array forests from forest_compiler.py) or "auto":
+# compiled for small batches, where sklearn's per-call overhead dominates, and
+# sklearn's C traversal for large ones. Both give identical probabilities.
+PREDICT_BACKEND = os.environ.get("PREDICT_BACKEND", "auto")
+COMPILED_MAX_ROWS = int(os.environ.get("COMPILED_MAX_ROWS", 1000))
+
+def _require_model(disaster: str, n_rows: int = 1):
     model_meta = load_model(disaster)
     if not model_meta:
         raise ValueError(f"Model for {disaster} not found. Train models first.")
-    model, meta = model_meta
+    if hasattr(model_meta[0], "build_id"):
+        # mmap artifact: load_model already returns the shared, memory-mapped CompiledForest
+        return model_meta
+    # pickled sklearn forest: use its private flat-array copy for small batches
+    if PREDICT_BACKEND == "compiled" or (PREDICT_BACKEND == "auto" and n_rows <= COMPILED_MAX_ROWS):
+        from forest_compiler import load_compiled
+        # only a copy exported from this exact artifact (a stale one is ignored)
+        compiled = load_compiled(disaster, model_version(disaster))
+        if compiled is not None:
+            return compiled, model_meta[1]
+    return model_meta
+
+def warm_up(disasters=None, background: bool = True):
+    """
+    Load each model (and its compiled form) into the registry and run one
+    throwaway prediction, so the first real request doesn't pay for
+    unpickling/imports. Returns the thread when background=True.
+    """
+    def run():
+        for d in disasters or THRESHOLDS:
+            try:
+                model, meta = _require_model(d)
+                model.predict_proba(np.zeros((1, len(meta.get("features", [])))))
+            except Exception:
+                pass  # missing/broken models are reported when actually used
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def _score(disaster: str, features_dict: dict):
+    """Probability for one feature record (missing features -> 0), through the memo cache if enabled."""
+    model, meta = _require_model(disaster)
     feat_list = meta.get("features", [])
-    X = np.array([[features_dict.get(f, 0) for f in feat_list]])
+    memo = prediction_cache.CACHE
+    key = None
+    with metrics.timer("predict.features"):
+        values = [features_dict.get(f, 0) for f in feat_list]
+        if memo.enabled:
+            values = memo.quantize(feat_list, values)
+            key = (disaster, model_version(disaster), values)
+        X = np.array([values])
 
-    proba = model.predict_proba(X)[0][1]
+    proba = memo.get(key) if key is not None else None
+    if proba is None:
+        with metrics.timer("predict.predict_proba", disaster=disaster):
+            proba = model.predict_proba(X)[0][1]
+        if key is not None:
+            memo.put(key, float(proba))
+    return proba
+
+def predict(disaster: str, features_dict: dict, location: str = None):
+    proba = _score(disaster, features_dict)
     threshold = THRESHOLDS.get(disaster, 0.6)
     alert_flag = proba >= threshold
+    metrics.inc("predictions_total", disaster=disaster)
+    if alert_flag:
+        metrics.inc("alerts_total", disaster=disaster)
 
     message = f"{disaster.capitalize()} probability {proba:.3f}"
     if alert_flag:
-        add_alert(disaster, float(proba), message)
+        if SUPPRESSOR.enabled:
+            SUPPRESSOR.submit(disaster, float(proba), message, location)
+        else:
+            add_alert(disaster, float(proba), message)
         log_event("alert_generated", f"{disaster} prob={proba}")
     else:
         log_event("prediction", f"{disaster} prob={proba}")
@@ -36,3 +105,115 @@ def predict(disaster: str, features_dict: dict):
         "alert": alert_flag,
         "message": message
     }
+
+# one shared pool for predict_all; tree traversal in sklearn/NumPy releases the GIL
+_all_pool = None
+_all_pool_lock = threading.Lock()
+
+def _pool():
+    global _all_pool
+    with _all_pool_lock:
+        if _all_pool is None:
+            _all_pool = ThreadPoolExecutor(max_workers=len(THRESHOLDS), thread_name_prefix="predict-all")
+    return _all_pool
+
+def predict_all(features_dict: dict, record: bool = True, location: str = None, disasters=None):
+    """
+    Score one shared feature record with every hazard model concurrently.
+    Each model takes the features it lists in meta["features"] (missing -> 0,
+    like predict()). Alerts and logs for all hazards are written together:
+    in one transaction (one write-behind batch with DB_WRITE_BEHIND=1), or
+    alerts through the suppressor when it is enabled.
+    Returns {"hazards": {disaster: result}, "alerts": [...], "highest": disaster,
+    "errors": {disaster: message}}; a missing or broken model only fills errors.
+    """
+    disasters = list(disasters or THRESHOLDS)
+    with metrics.timer("predict_all"):
+        futures = {d: _pool().submit(_score, d, features_dict) for d in disasters}
+        hazards, errors = {}, {}
+        for d, fut in futures.items():
+            try:
+                proba = float(fut.result())
+            except Exception as e:
+                errors[d] = str(e)
+                continue
+            threshold = THRESHOLDS.get(d, 0.6)
+            hazards[d] = {
+                "probability": proba,
+                "threshold": threshold,
+                "alert": proba >= threshold,
+                "message": f"{d.capitalize()} probability {proba:.3f}",
+            }
+
+    alerted = [d for d, r in hazards.items() if r["alert"]]
+    for d in hazards:
+        metrics.inc("predictions_total", disaster=d)
+    for d in alerted:
+        metrics.inc("alerts_total", disaster=d)
+
+    if record and hazards:
+        alerts = [(d, hazards[d]["probability"], hazards[d]["message"]) for d in alerted]
+        logs = [("alert_generated" if r["alert"] else "prediction", f"{d} prob={r['probability']}")
+                for d, r in hazards.items()]
+        if SUPPRESSOR.enabled and alerts:
+            SUPPRESSOR.submit_many([row + (location,) for row in alerts])
+            alerts = []
+        record_predictions(alerts, logs)
+
+    return {
+        "hazards": hazards,
+        "alerts": alerted,
+        "highest": max(hazards, key=lambda d: hazards[d]["probability"]) if hazards else None,
+        "errors": errors,
+    }
+
+def _batch_matrix(X, feat_list):
+    # DataFrames are aligned by column name (missing features -> 0, like predict());
+    # plain arrays must already be in meta["features"] order.
+    if hasattr(X, "reindex"):
+        return X.reindex(columns=feat_list, fill_value=0).to_numpy(dtype=float)
+    X = np.asarray(X, dtype=float)
+    if X.ndim != 2 or X.shape[1] != len(feat_list):
+        raise ValueError(f"Expected a 2-D array with {len(feat_list)} columns ({feat_list}), got shape {X.shape}")
+    return X
+
+def predict_batch(disaster: str, X, record: bool = True, location=None):
+    """
+    Score many rows with a single predict_proba call.
+    Alerts/logs for the whole batch are written in one transaction when record=True.
+    location is one key for the whole batch or one per row (alert suppression).
+    """
+    model, meta = _require_model(disaster, n_rows=len(X))
+    feat_list = meta.get("features", [])
+    with metrics.timer("predict_batch.features"):
+        X = _batch_matrix(X, feat_list)
+    threshold = THRESHOLDS.get(disaster, 0.6)
+
+    if len(X) == 0:
+        proba = np.empty(0, dtype=float)
+    else:
+        with metrics.timer("predict_batch.predict_proba", disaster=disaster):
+            proba = model.predict_proba(X)[:, 1]
+    alert_flags = proba >= threshold
+    metrics.inc("predictions_total", len(proba), disaster=disaster)
+    metrics.inc("alerts_total", int(alert_flags.sum()), disaster=disaster)
+
+    if record and len(proba):
+        label = disaster.capitalize()
+        alerts = [(disaster, float(p), f"{label} probability {p:.3f}") for p in proba[alert_flags]]
+        logs = [("alert_generated" if a else "prediction", f"{disaster} prob={p}")
+                for p, a in zip(proba, alert_flags)]
+        if SUPPRESSOR.enabled and alerts:
+            if location is None or isinstance(location, str):
+                locations = [location] * len(alerts)
+            else:
+                locations = [loc for loc, a in zip(location, alert_flags) if a]
+            SUPPRESSOR.submit_many([row + (loc,) for row, loc in zip(alerts, locations)])
+            alerts = []
+        record_predictions(alerts, logs)
+
+    return {
+        "probability": proba,
+        "threshold": threshold,
+        "alert": alert_flags,
+    }
@@ -0,0 +1,181 @@
+# Retention for the logs table.
+#
+# Raw log rows older than the cutoff are
+#   1. appended to gzip JSONL archives, one file per day: logs_archive/logs-YYYY-MM-DD.jsonl.gz
+#   2. rolled up into log_rollups (hour, event_type, disaster): count, mean/max probability
+#   3. deleted from logs
+# in batches of --batch-size rows, one short transaction per batch, so readers
+# and log_event writers are never blocked for long. The archive is written
+# before the batch commits: a crash can leave a duplicated batch in the
+# archive, never a lost one. Each batch takes the write lock (BEGIN IMMEDIATE)
+# before selecting its rows, so concurrent runners (the background thread of
+# several app processes, or the thread plus the CLI) never roll up or archive
+# the same rows twice.
+#
+#   python src/retention.py --days 7                 # one pass
+#   python src/retention.py --days 7 --every 3600    # run hourly in the foreground
+import os
+import re
+import gzip
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+
+import utils_db
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), "..")
+ARCHIVE_DIR = os.path.abspath(os.path.join(BASE_DIR, "logs_archive"))
+LOG_RETENTION_DAYS = float(os.environ.get("LOG_RETENTION_DAYS", 7))
+
+# "flood prob=0.71" (predictions/alerts) and "flood, prob=0.5, msg=..." (manual alerts)
+_PROB_RE = re.compile(r"^(\w+),? prob=([-+0-9.eE]+)")
+
+_ROLLUP_SQL = """
+INSERT INTO log_rollups (hour, event_type, disaster, count, prob_count, prob_sum, prob_max)
+VALUES (?,?,?,?,?,?,?)
+ON CONFLICT (hour, event_type, disaster) DO UPDATE SET
+    count = count + excluded.count,
+    prob_count = prob_count + excluded.prob_count,
+    prob_sum = prob_sum + excluded.prob_sum,
+    prob_max = CASE WHEN prob_max IS NULL OR excluded.prob_max > prob_max
+                    THEN excluded.prob_max ELSE prob_max END
+"""
+
+_thread = None
+
+
+def parse_details(details: str):
+    """(disaster, probability) from a log row's details; ("", None) if it has none."""
+    m = _PROB_RE.match(details or "")
+    if not m:
+        return "", None
+    try:
+        return m.group(1), float(m.group(2))
+    except ValueError:
+        return m.group(1), None
+
+
+def _rollup(rows):
+    groups = {}
+    for _, ts, event_type, details in rows:
+        disaster, prob = parse_details(details)
+        key = ((ts or "")[:13] + ":00:00", event_type or "", disaster)
+        g = groups.setdefault(key, [0, 0, 0.0, None])
+        g[0] += 1
+        if prob is not None:
+            g[1] += 1
+            g[2] += prob
+            g[3] = prob if g[3] is None else max(g[3], prob)
+    return [k + tuple(v) for k, v in groups.items()]
+
+
+def _archive(rows, archive_dir):
+    by_day = {}
+    for row_id, ts, event_type, details in rows:
+        by_day.setdefault((ts or "unknown")[:10], []).append(
+            {"id": row_id, "timestamp": ts, "event_type": event_type, "details": details})
+    os.makedirs(archive_dir, exist_ok=True)
+    for day, records in by_day.items():
+        # each batch is appended as its own gzip member; gzip.open reads them back as one stream
+        with gzip.open(os.path.join(archive_dir, f"logs-{day}.jsonl.gz"), "at") as f:
+            for r in records:
+                f.write(json.dumps(r) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    return len(by_day)
+
+
+def run_retention(days: float = LOG_RETENTION_DAYS, batch_size: int = 5000, archive: bool = True,
+                  archive_dir: str = None, pause: float = 0.0, vacuum: bool = False) -> dict:
+    """Archive, roll up and delete logs older than `days`. Returns counts."""
+    archive_dir = archive_dir or ARCHIVE_DIR
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    utils_db.flush_writes()
+    stats = {"cutoff": cutoff, "rows": 0, "batches": 0, "rollup_rows": 0}
+    start = time.perf_counter()
+    conn = utils_db.get_conn()
+    try:
+        while True:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                rows = conn.execute(
+                    "SELECT id, timestamp, event_type, details FROM logs "
+                    "WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?",
+                    (cutoff, batch_size)).fetchall()
+                if not rows:
+                    conn.rollback()
+                    break
+                if archive:
+                    _archive(rows, archive_dir)
+                rollups = _rollup(rows)
+                conn.executemany(_ROLLUP_SQL, rollups)
+                conn.executemany("DELETE FROM logs WHERE id=?", [(r[0],) for r in rows])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            stats["rows"] += len(rows)
+            stats["batches"] += 1
+            stats["rollup_rows"] += len(rollups)
+            if pause:
+                time.sleep(pause)
+        if vacuum and stats["rows"]:
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def start_background(interval: float = 3600, **kwargs):
+    """Run run_retention(**kwargs) every `interval` seconds in a daemon thread (once per process)."""
+    global _thread
+    if _thread is not None:
+        return _thread
+
+    def loop():
+        while True:
+            try:
+                stats = run_retention(**kwargs)
+                if stats["rows"]:
+                    utils_db.log_event("log_retention", f"{stats['rows']} rows before {stats['cutoff']}")
+            except Exception as e:
+                print(f"log retention failed: {e}")
+            time.sleep(interval)
+
+    _thread = threading.Thread(target=loop, name="log-retention", daemon=True)
+    _thread.start()
+    return _thread
+
+
+def read_archive(path: str):
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive, roll up and delete old rows of the logs table.")
+    parser.add_argument("--days", type=float, default=LOG_RETENTION_DAYS, help="keep this many days of raw logs")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per delete transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--no-archive", action="store_true", help="roll up and delete without archiving")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to shrink the file")
+    parser.add_argument("--every", type=float, default=0, help="repeat every N seconds")
+    args = parser.parse_args()
+
+    while True:
+        stats = run_retention(args.days, batch_size=args.batch_size, archive=not args.no_archive,
+                              archive_dir=args.archive_dir, pause=args.pause, vacuum=args.vacuum)
+        print(f"{stats['rows']} log rows before {stats['cutoff']} archived/rolled up in "
+              f"{stats['batches']} batches ({stats['seconds']:.2f}s)")
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
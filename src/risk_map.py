@@ -0,0 +1,241 @@
+# Regional risk maps from gridded feature rasters.
+#
+# A raster directory holds one 2-D .npy array per model feature, all the same
+# shape (e.g. rainfall_mm.npy, slope_degree.npy, soil_moisture.npy); features
+# without a raster can be given a constant with --const name=value. NaN cells
+# are treated as no-data.
+#
+# The grid is split into tiles that are scored in a process pool through
+# predictors.predict_batch (record=False). Inputs are opened with
+# mmap_mode="r" and results are written in place into memory-mapped outputs:
+#   <out>/<disaster>_probability.npy   float32, NaN where no-data
+#   <out>/<disaster>_exceedance.npy    bool, probability >= THRESHOLDS[disaster]
+#   <out>/<disaster>_tiles.json        per-tile input hash + model version
+# A re-run only re-scores tiles whose input hash changed (or all of them when
+# the model, threshold, tile size or grid changes).
+#
+#   python src/risk_map.py synthetic rasters/ --disaster landslide --shape 2048 2048
+#   python src/risk_map.py score landslide rasters/ maps/ --tile 256 --workers 4
+import os
+import json
+import time
+import hashlib
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model_utils import load_model, model_version
+from predictors import predict_batch, THRESHOLDS
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+_worker = {}
+
+
+def _output_paths(out_dir, disaster):
+    return (os.path.join(out_dir, f"{disaster}_probability.npy"),
+            os.path.join(out_dir, f"{disaster}_exceedance.npy"),
+            os.path.join(out_dir, f"{disaster}_tiles.json"))
+
+
+def open_rasters(raster_dir: str, features, consts=None):
+    """{feature: memory-mapped 2-D array}, plus the common grid shape."""
+    consts = consts or {}
+    rasters, missing = {}, []
+    for f in features:
+        path = os.path.join(raster_dir, f"{f}.npy")
+        if os.path.exists(path):
+            rasters[f] = np.load(path, mmap_mode="r")
+        elif f not in consts:
+            missing.append(f)
+    if missing:
+        raise ValueError(f"No raster for {missing} in {raster_dir}; add {', '.join(m + '.npy' for m in missing)} "
+                         f"or pass --const name=value")
+    if not rasters:
+        raise ValueError(f"No feature rasters found in {raster_dir}")
+    shapes = {a.shape for a in rasters.values()}
+    if len(shapes) != 1 or len(next(iter(shapes))) != 2:
+        raise ValueError(f"Rasters must be 2-D and the same shape, got { {f: a.shape for f, a in rasters.items()} }")
+    return rasters, shapes.pop()
+
+
+def tiles(shape, tile: int):
+    rows, cols = shape
+    for r0 in range(0, rows, tile):
+        for c0 in range(0, cols, tile):
+            yield r0, min(r0 + tile, rows), c0, min(c0 + tile, cols)
+
+
+# -- worker side ------------------------------------------------------------
+def _init_worker(disaster, raster_dir, features, consts, prob_path, mask_path, version):
+    model, _ = load_model(disaster)
+    if hasattr(model, "n_jobs"):
+        model.n_jobs = 1  # parallelism comes from the process pool
+    # tiles are plain arrays in meta["features"] order
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    rasters, _ = open_rasters(raster_dir, features, consts)
+    _worker.update(disaster=disaster, features=features, consts=consts, rasters=rasters, version=version,
+                   prob=np.load(prob_path, mmap_mode="r+"), mask=np.load(mask_path, mmap_mode="r+"))
+
+
+def _tile_hash(r0, r1, c0, c1):
+    h = hashlib.blake2b(digest_size=16)
+    threshold = THRESHOLDS.get(_worker["disaster"], 0.6)
+    h.update(f"{_worker['version']}|{threshold}|{r0}:{r1},{c0}:{c1}|{sorted(_worker['consts'].items())}".encode())
+    for f in _worker["features"]:
+        if f in _worker["rasters"]:
+            h.update(np.ascontiguousarray(_worker["rasters"][f][r0:r1, c0:c1]).tobytes())
+    return h.hexdigest()
+
+
+def _score_tile(task):
+    (r0, r1, c0, c1), old_hash = task
+    digest = _tile_hash(r0, r1, c0, c1)
+    if digest == old_hash:
+        return (r0, c0), digest, 0
+
+    n = (r1 - r0) * (c1 - c0)
+    X = np.empty((n, len(_worker["features"])), dtype=float)
+    for j, f in enumerate(_worker["features"]):
+        if f in _worker["rasters"]:
+            X[:, j] = _worker["rasters"][f][r0:r1, c0:c1].ravel()
+        else:
+            X[:, j] = _worker["consts"][f]
+    valid = np.isfinite(X).all(axis=1)
+
+    prob = np.full(n, np.nan, dtype=np.float32)
+    mask = np.zeros(n, dtype=bool)
+    if valid.any():
+        res = predict_batch(_worker["disaster"], X[valid], record=False)
+        prob[valid] = res["probability"]
+        mask[valid] = res["alert"]
+    _worker["prob"][r0:r1, c0:c1] = prob.reshape(r1 - r0, c1 - c0)
+    _worker["mask"][r0:r1, c0:c1] = mask.reshape(r1 - r0, c1 - c0)
+    return (r0, c0), digest, n
+
+
+# -- driver -----------------------------------------------------------------
+def score_map(disaster: str, raster_dir: str, out_dir: str, tile: int = 256, workers: int = None,
+              consts: dict = None, force: bool = False) -> dict:
+    """Score every changed tile of the raster grid; returns a summary dict."""
+    consts = consts or {}
+    model_meta = load_model(disaster)
+    if not model_meta:
+        raise ValueError(f"Model for {disaster} not found. Train models first.")
+    features = model_meta[1].get("features", [])
+    version = model_version(disaster)
+    _, shape = open_rasters(raster_dir, features, consts)
+
+    os.makedirs(out_dir, exist_ok=True)
+    prob_path, mask_path, manifest_path = _output_paths(out_dir, disaster)
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    if (manifest.get("shape") != list(shape) or manifest.get("tile") != tile
+            or not os.path.exists(prob_path) or not os.path.exists(mask_path)):
+        manifest = {}
+    if not manifest:
+        np.lib.format.open_memmap(prob_path, mode="w+", dtype=np.float32, shape=shape)[:] = np.nan
+        np.lib.format.open_memmap(mask_path, mode="w+", dtype=bool, shape=shape)
+    old = manifest.get("tiles", {})
+
+    tasks = [(t, old.get(f"{t[0]}_{t[2]}")) for t in tiles(shape, tile)]
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    new_hashes, scored_tiles, scored_cells = {}, 0, 0
+    init_args = (disaster, raster_dir, features, consts, prob_path, mask_path, version)
+    if workers == 1:
+        _init_worker(*init_args)
+        results = map(_score_tile, tasks)
+    else:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=init_args)
+        results = pool.map(_score_tile, tasks, chunksize=max(1, len(tasks) // (workers * 8)))
+    try:
+        for (r0, c0), digest, n in results:
+            new_hashes[f"{r0}_{c0}"] = digest
+            if n:
+                scored_tiles += 1
+                scored_cells += n
+    finally:
+        if workers != 1:
+            pool.shutdown()
+    elapsed = time.perf_counter() - start
+
+    manifest = {"disaster": disaster, "model_version": version, "features": features, "consts": consts,
+                "shape": list(shape), "tile": tile, "threshold": THRESHOLDS.get(disaster, 0.6),
+                "tiles": new_hashes}
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_path)
+
+    mask = np.load(mask_path, mmap_mode="r")
+    return {"shape": shape, "tiles": len(tasks), "scored_tiles": scored_tiles, "scored_cells": scored_cells,
+            "seconds": elapsed, "cells_per_s": scored_cells / elapsed if elapsed > 0 else 0.0,
+            "exceedance_cells": int(mask.sum()), "probability": prob_path, "exceedance": mask_path}
+
+
+def write_synthetic(raster_dir: str, disaster: str, shape, seed: int = 0):
+    """Smooth random rasters for every feature of `disaster`, in the range of data/<disaster>_dataset.csv."""
+    df = pd.read_csv(os.path.join(DATA_DIR, f"{disaster}_dataset.csv"))
+    rng = np.random.default_rng(seed)
+    rows, cols = shape
+    yy, xx = np.mgrid[0:rows, 0:cols].astype(np.float32)
+    os.makedirs(raster_dir, exist_ok=True)
+    for f in df.columns.drop("label", errors="ignore"):
+        lo, hi = float(df[f].min()), float(df[f].max())
+        fx, fy, px, py = rng.uniform(1, 6, 2).tolist() + rng.uniform(0, 2 * np.pi, 2).tolist()
+        field = (np.sin(xx / cols * fx * np.pi + px) + np.cos(yy / rows * fy * np.pi + py)) / 4 + 0.5
+        field += rng.normal(0, 0.05, shape).astype(np.float32)
+        np.save(os.path.join(raster_dir, f"{f}.npy"), (lo + np.clip(field, 0, 1) * (hi - lo)).astype(np.float32))
+    return sorted(df.columns.drop("label", errors="ignore"))
+
+
+def _parse_consts(items):
+    out = {}
+    for item in items or []:
+        name, _, value = item.partition("=")
+        out[name] = float(value)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled, incremental regional risk maps.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    score = sub.add_parser("score", help="score a raster directory")
+    score.add_argument("disaster", choices=sorted(THRESHOLDS))
+    score.add_argument("raster_dir")
+    score.add_argument("out_dir")
+    score.add_argument("--tile", type=int, default=256, help="tile edge length in cells")
+    score.add_argument("--workers", type=int, default=None)
+    score.add_argument("--const", nargs="*", metavar="NAME=VALUE", help="constant value for features without a raster")
+    score.add_argument("--force", action="store_true", help="re-score every tile")
+
+    synth = sub.add_parser("synthetic", help="write synthetic feature rasters for testing")
+    synth.add_argument("raster_dir")
+    synth.add_argument("--disaster", choices=sorted(THRESHOLDS), default="landslide")
+    synth.add_argument("--shape", type=int, nargs=2, default=(1024, 1024))
+    synth.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "synthetic":
+        names = write_synthetic(args.raster_dir, args.disaster, tuple(args.shape), args.seed)
+        print(f"Wrote {len(names)} rasters of shape {tuple(args.shape)} to {args.raster_dir}: {', '.join(names)}")
+        return
+    try:
+        s = score_map(args.disaster, args.raster_dir, args.out_dir, tile=args.tile, workers=args.workers,
+                      consts=_parse_consts(args.const), force=args.force)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{s['scored_tiles']}/{s['tiles']} tiles re-scored ({s['scored_cells']} cells) in {s['seconds']:.2f}s "
+          f"({s['cells_per_s']:.0f} cells/s); {s['exceedance_cells']} cells above threshold")
+    print(f"  {s['probability']}\n  {s['exceedance']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Cold-start profiling.
+#
+# Every measurement runs in a fresh interpreter, as a new Streamlit worker or
+# a short CLI job would:
+#   * import cost of the modules on the app/prediction path (python -X importtime),
+#     with the heaviest transitive imports listed
+#   * time to first prediction: import predictors -> load_model -> predict()
+#     (against a throwaway database)
+# With --max-first-prediction-ms the script exits 1 when the budget is
+# exceeded, so it can run as a startup-time check in CI.
+#
+#   python src/startup_profile.py
+#   python src/startup_profile.py --disaster flood --max-first-prediction-ms 1500
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODULES = ["predictors", "ui_data", "score_csv", "ingest_server"]
+
+_FIRST_PREDICTION = r"""
+import json, os, sys, tempfile, time
+start = time.perf_counter()
+import predictors
+t_import = time.perf_counter()
+import utils_db, db_init
+utils_db.DB_PATH = db_init.DB_PATH = os.path.join(tempfile.mkdtemp(), "startup.db")
+import contextlib, io
+with contextlib.redirect_stdout(io.StringIO()):
+    db_init.init_db()
+t_db = time.perf_counter()
+from model_utils import load_model, _artifact_path
+model_meta = load_model(sys.argv[1])
+if not model_meta:
+    raise SystemExit(f"no model for {sys.argv[1]}")
+t_load = time.perf_counter()
+features = {f: 1.0 for f in model_meta[1].get("features", [])}
+predictors.predict(sys.argv[1], features)
+t_first = time.perf_counter()
+predictors.predict(sys.argv[1], features)
+t_second = time.perf_counter()
+print(json.dumps({
+    "import_ms": 1000 * (t_import - start),
+    "load_model_ms": 1000 * (t_load - t_db),
+    "first_predict_ms": 1000 * (t_first - t_load),
+    "second_predict_ms": 1000 * (t_second - t_first),
+    "time_to_first_prediction_ms": 1000 * ((t_import - start) + (t_first - t_db)),
+    "format": "mmap" if _artifact_path(sys.argv[1]).endswith("meta.json") else "pickle",
+    "sklearn_imported": "sklearn" in sys.modules,
+    "pandas_imported": "pandas" in sys.modules,
+}))
+"""
+
+
+def import_profile(module: str, top: int = 8):
+    """(total_ms, [(cumulative_ms, module), ...]) for importing `module` in a fresh interpreter."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=SRC_DIR, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{out.stderr[-2000:]}")
+    rows = []
+    for line in out.stderr.splitlines():
+        # "import time: <self us> | <cumulative us> | <indented module name>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us) / 1000, name.strip()))
+    # drop interpreter startup (site and what it pulls in), which every process pays anyway
+    site = max((i for i, (_, name) in enumerate(rows) if name == "site"), default=-1)
+    rows = rows[site + 1:]
+    total = next((ms for ms, name in reversed(rows) if name == module), 0.0)
+    # packages only (submodules are already included in their package's cumulative time)
+    heavy = sorted(((ms, name) for ms, name in rows if name != module and "." not in name),
+                   reverse=True)[:top]
+    return total, heavy
+
+
+def first_prediction(disaster: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", _FIRST_PREDICTION, disaster],
+                         cwd=SRC_DIR, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"first prediction failed:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and time-to-first-prediction profile.")
+    parser.add_argument("--modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--disaster", default="flood")
+    parser.add_argument("--top", type=int, default=8, help="heaviest imports to list per module")
+    parser.add_argument("--max-first-prediction-ms", type=float, default=None,
+                        help="exit 1 if time to first prediction exceeds this")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        total, heavy = import_profile(module, args.top)
+        print(f"import {module}: {total:.0f} ms")
+        for ms, name in heavy:
+            print(f"    {ms:8.1f} ms  {name}")
+
+    res = first_prediction(args.disaster)
+    print(f"\nfirst prediction ({args.disaster}): import {res['import_ms']:.0f} ms, "
+          f"load_model {res['load_model_ms']:.0f} ms, first predict {res['first_predict_ms']:.1f} ms, "
+          f"second predict {res['second_predict_ms']:.1f} ms")
+    print(f"time to first prediction: {res['time_to_first_prediction_ms']:.0f} ms "
+          f"({res['format']} model; sklearn imported: {res['sklearn_imported']}, "
+          f"pandas imported: {res['pandas_imported']})")
+    if res["format"] == "pickle":
+        print("  hint: `python src/model_utils.py` converts models to the mmap format, which loads without sklearn")
+    if args.max_first_prediction_ms is not None and res["time_to_first_prediction_ms"] > args.max_first_prediction_ms:
+        print(f"FAIL: above the {args.max_first_prediction_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
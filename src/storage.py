@@ -0,0 +1,101 @@
+# Pooled database access (SQLAlchemy).
+#
+# One engine per database URL, shared by every thread of the process:
+#   * DATABASE_URL (e.g. postgresql+psycopg2://user:pw@host/disaster) selects a
+#     server database; otherwise the SQLite file passed by the caller
+#     (utils_db.DB_PATH / db_init.DB_PATH) is used.
+#   * SQLite connections use WAL journaling (readers don't block the writer),
+#     synchronous=NORMAL and a busy timeout (DB_BUSY_TIMEOUT_MS, default 5000),
+#     so concurrent sessions wait for the write lock instead of failing with
+#     "database is locked".
+#   * Connections go back to a pool (DB_POOL_SIZE, DB_MAX_OVERFLOW) instead of
+#     being opened and closed for every operation.
+# utils_db and db_init run named-parameter SQL through begin()/connect();
+# raw_connection() hands out a pooled DB-API connection for qmark-style code
+# (retention, write-behind, benchmark), which is SQLite-only.
+# SQLAlchemy is imported on first use, not when predictors/utils_db are imported.
+import os
+import threading
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def database_url(db_path: str) -> str:
+    return DATABASE_URL or f"sqlite:///{os.path.abspath(db_path)}"
+
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cur.close()
+
+
+def text(sql: str):
+    """sqlalchemy.text(), imported lazily."""
+    from sqlalchemy import text as _text
+    return _text(sql)
+
+
+def bindparam(*args, **kwargs):
+    """sqlalchemy.bindparam(), imported lazily."""
+    from sqlalchemy import bindparam as _bindparam
+    return _bindparam(*args, **kwargs)
+
+
+def get_engine(db_path: str):
+    url = database_url(db_path)
+    engine = _engines.get(url)
+    if engine is not None:
+        return engine
+    from sqlalchemy import create_engine, event
+    with _lock:
+        if url not in _engines:
+            if url.startswith("sqlite"):
+                engine = create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                       connect_args={"check_same_thread": False,
+                                                     "timeout": DB_BUSY_TIMEOUT_MS / 1000})
+                event.listen(engine, "connect", _sqlite_pragmas)
+            else:
+                engine = create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                       pool_pre_ping=True)
+            _engines[url] = engine
+        return _engines[url]
+
+
+def begin(db_path: str):
+    """Connection in a transaction: `with begin(path) as conn:` commits on success, rolls back on error."""
+    return get_engine(db_path).begin()
+
+
+def connect(db_path: str):
+    """Connection for reads: `with connect(path) as conn:`."""
+    return get_engine(db_path).connect()
+
+
+def raw_connection(db_path: str):
+    """Pooled DB-API connection; close() returns it to the pool."""
+    return get_engine(db_path).raw_connection()
+
+
+def dialect(db_path: str) -> str:
+    return get_engine(db_path).dialect.name
+
+
+def dispose():
+    """Close every pooled connection (e.g. after fork or between stress-test runs)."""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def pool_stats() -> dict:
+    return {url.split("@")[-1]: engine.pool.status() for url, engine in list(_engines.items())}
@@ -1,24 +1,52 @@
 import os
+import time
+import argparse
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split, StratifiedKFold, GridSearchCV
-from sklearn.metrics import accuracy_score, roc_auc_score, make_scorer
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, roc_auc_score
 from model_utils import save_model
+from dataset_cache import read_dataset
+from model_search import SEARCH_STRATEGIES
+import training_manifest
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
 
-def train_generic(csv_path, features, label_col="label", model_name="model"):
-    print("\n==============================")
-    print(f" Training: {model_name}")
-    print("==============================")
+# Hyperparameter grid
+PARAM_GRID = {
+    'n_estimators': [200, 300],
+    'max_depth': [None, 10, 20],
+    'min_samples_split': [2, 5],
+    'min_samples_leaf': [1, 2],
+}
+
+DATASETS = [
+    ("landslide_dataset.csv", ["rainfall_mm", "slope_degree", "soil_moisture",
+                              "population_density", "infrastructure_index"], "landslide"),
+    ("wildfire_dataset.csv", ["temperature_c", "humidity_pct", "vegetation_index",
+                              "soil_moisture", "population_density"], "wildfire"),
+    ("cyclone_dataset.csv", ["wind_speed_kmph", "pressure_hpa", "humidity_pct",
+                             "tide_height_m", "population_density"], "cyclone"),
+    ("earthquake_dataset.csv", ["magnitude", "depth_km", "population_density",
+                                "infrastructure_index", "historical_quakes_50km",
+                                "aftershock_risk_score"], "earthquake"),
+    ("flood_dataset.csv", ["rainfall_mm", "river_level_m", "soil_moisture",
+                           "population_density", "infrastructure_index"], "flood"),
+]
+
+
+def base_estimator(n_jobs=-1):
+    return RandomForestClassifier(random_state=42, class_weight="balanced", n_jobs=n_jobs)
+
 
-    df = pd.read_csv(csv_path)
+def load_training_data(csv_path, features, label_col="label"):
+    df = read_dataset(csv_path)
     df = df.dropna()
     print("Label distribution:", df[label_col].value_counts().to_dict())
 
-    if df[label_col].dtype == "object":
+    if df[label_col].dtype == "object" or isinstance(df[label_col].dtype, pd.CategoricalDtype):
         df[label_col] = df[label_col].astype("category").cat.codes
 
     X = df[features]
@@ -26,37 +54,13 @@ def train_generic(csv_path, features, label_col="label", model_name="model"):
 
     # Stratified split
     try:
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y
-        )
+        return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
     except ValueError:
         print("⚠ Stratified split failed: dataset may contain only one class!")
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
-
-    # Hyperparameter grid
-    param_grid = {
-        'n_estimators': [200, 300],
-        'max_depth': [None, 10, 20],
-        'min_samples_split': [2, 5],
-        'min_samples_leaf': [1, 2],
-    }
-
-    # Optimize for AUC
-    auc_scorer = make_scorer(roc_auc_score, needs_proba=True)
-
-    clf = GridSearchCV(
-        RandomForestClassifier(random_state=42, class_weight="balanced", n_jobs=-1),
-        param_grid,
-        cv=StratifiedKFold(n_splits=5),
-        scoring=auc_scorer,
-        n_jobs=-1
-    )
-
-    clf.fit(X_train, y_train)
-
-    best_model = clf.best_estimator_
+        return train_test_split(X, y, test_size=0.2, random_state=42)
+
+
+def evaluate_and_save(best_model, X_test, y_test, features, model_name, extra_meta=None):
     y_pred = best_model.predict(X_test)
     acc = accuracy_score(y_test, y_pred)
     print(f"{model_name} trained. Test Accuracy: {acc:.2%}")
@@ -72,31 +76,118 @@ def train_generic(csv_path, features, label_col="label", model_name="model"):
         print(f"Test AUC: {auc:.3f}")
 
     # Save model with accuracy and auc
-    save_model(model_name, best_model, meta={"features": features, "accuracy": acc, "auc": auc})
+    meta = {"features": features, "accuracy": acc, "auc": auc}
+    meta.update(extra_meta or {})
+    # also writes the flat-array copy of the forest for the "compiled" predictor backend
+    save_model(model_name, best_model, meta=meta)
+    return acc, auc
+
+
+def run_search(search, X_train, y_train):
+    """Fit a model with one of model_search.SEARCH_STRATEGIES; returns (model, info, seconds)."""
+    start = time.perf_counter()
+    if search == "oob":
+        model, info = SEARCH_STRATEGIES[search](base_estimator(), X_train, y_train)
+    else:
+        model, info = SEARCH_STRATEGIES[search](base_estimator(), X_train, y_train, PARAM_GRID)
+    return model, info, time.perf_counter() - start
+
+
+def train_generic(csv_path, features, label_col="label", model_name="model", search="grid",
+                  lineage=None):
+    print("\n==============================")
+    print(f" Training: {model_name} ({search} search)")
+    print("==============================")
+
+    X_train, X_test, y_train, y_test = load_training_data(csv_path, features, label_col)
+
+    best_model, info, seconds = run_search(search, X_train, y_train)
+    print(f"Search: {info['fits']} forests fitted in {seconds:.1f}s, best params {info['best_params']}")
+
+    evaluate_and_save(best_model, X_test, y_test, features, model_name,
+                      extra_meta={"search": search, "train_seconds": seconds, "lineage": lineage})
     return best_model
 
 
+def compare_search(csv_path, features, label_col="label", model_name="model", strategies=None):
+    """Time-to-model and test AUC for each search strategy side by side (nothing is saved)."""
+    strategies = strategies or list(SEARCH_STRATEGIES)
+    X_train, X_test, y_train, y_test = load_training_data(csv_path, features, label_col)
+    results = {}
+    for search in strategies:
+        model, info, seconds = run_search(search, X_train, y_train)
+        auc = None
+        if len(set(y_test)) > 1:
+            auc = roc_auc_score(y_test, model.predict_proba(X_test)[:, 1])
+        results[search] = {"seconds": seconds, "fits": info["fits"], "auc": auc,
+                           "best_params": info["best_params"]}
+
+    print(f"\n{model_name}: {'search':<10}{'seconds':>10}{'forests':>10}{'test AUC':>10}")
+    for search, r in results.items():
+        auc = f"{r['auc']:.4f}" if r["auc"] is not None else "n/a"
+        print(f"{'':<{len(model_name) + 2}}{search:<10}{r['seconds']:>10.1f}{r['fits']:>10}{auc:>10}")
+    return results
+
+
 def main():
-    datasets = [
-        ("landslide_dataset.csv", ["rainfall_mm", "slope_degree", "soil_moisture",
-                                  "population_density", "infrastructure_index"], "landslide"),
-        ("wildfire_dataset.csv", ["temperature_c", "humidity_pct", "vegetation_index",
-                                  "soil_moisture", "population_density"], "wildfire"),
-        ("cyclone_dataset.csv", ["wind_speed_kmph", "pressure_hpa", "humidity_pct",
-                                 "tide_height_m", "population_density"], "cyclone"),
-        ("earthquake_dataset.csv", ["magnitude", "depth_km", "population_density",
-                                    "infrastructure_index", "historical_quakes_50km",
-                                    "aftershock_risk_score"], "earthquake"),
-        ("flood_dataset.csv", ["rainfall_mm", "river_level_m", "soil_moisture",
-                               "population_density", "infrastructure_index"], "flood"),
-    ]
-
-    for csv_name, features, model_name in datasets:
+    parser = argparse.ArgumentParser(description="Train the disaster models.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="train all models in one shared pool of N worker processes "
+                             "(default: sequential, one model at a time)")
+    parser.add_argument("--search", choices=sorted(SEARCH_STRATEGIES), default="grid",
+                        help="hyperparameter search strategy (default: grid)")
+    parser.add_argument("--force", action="store_true",
+                        help="retrain every model even if its inputs are unchanged")
+    parser.add_argument("--out-of-core", choices=["sample", "binned"], default=None,
+                        help="stream each CSV in chunks and train a HistGradientBoosting model "
+                             "within --memory-mb (see out_of_core.py)")
+    parser.add_argument("--memory-mb", type=float, default=256,
+                        help="memory budget for --out-of-core training")
+    parser.add_argument("--compare-search", action="store_true",
+                        help="report time-to-model and test AUC of every search strategy "
+                             "instead of training")
+    args = parser.parse_args()
+    if args.workers and args.search != "grid":
+        parser.error("--workers only supports --search grid")
+    if args.workers and args.out_of_core:
+        parser.error("--workers cannot be combined with --out-of-core")
+
+    if args.compare_search:
+        for csv_name, features, model_name in DATASETS:
+            csv_path = os.path.join(DATA_DIR, csv_name)
+            if os.path.exists(csv_path):
+                compare_search(csv_path, features, model_name=model_name)
+        return
+
+    if args.workers:
+        from train_orchestrator import train_all
+        train_all(workers=args.workers, force=args.force)
+        return
+
+    manifest = training_manifest.load_manifest()
+    for csv_name, features, model_name in DATASETS:
         csv_path = os.path.join(DATA_DIR, csv_name)
-        if os.path.exists(csv_path):
-            train_generic(csv_path, features, model_name=model_name)
-        else:
+        if not os.path.exists(csv_path):
             print("Missing", csv_path)
+            continue
+        if args.out_of_core:
+            from out_of_core import HGB_PARAMS
+            inputs = training_manifest.training_inputs(csv_path, features,
+                                                       dict(HGB_PARAMS, memory_mb=args.memory_mb),
+                                                       f"out_of_core:{args.out_of_core}")
+        else:
+            inputs = training_manifest.training_inputs(csv_path, features, PARAM_GRID, args.search)
+        if not args.force and training_manifest.is_up_to_date(model_name, inputs, manifest):
+            print(f"{model_name}: inputs unchanged, skipping (use --force to retrain)")
+            continue
+        lineage = training_manifest.lineage(inputs)
+        if args.out_of_core:
+            from out_of_core import train_out_of_core
+            train_out_of_core(csv_path, features, model_name=model_name, mode=args.out_of_core,
+                              memory_mb=args.memory_mb, lineage=lineage)
+        else:
+            train_generic(csv_path, features, model_name=model_name, search=args.search, lineage=lineage)
+        training_manifest.record(model_name, inputs, lineage)
 
 
 if __name__ == "__main__":
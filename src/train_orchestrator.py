@@ -0,0 +1,142 @@
+# Train every disaster model in one shared worker pool.
+#
+# Each (model, grid candidate, CV fold) fit is an independent task, and every
+# forest runs with n_jobs=1, so the total CPU use is capped at `workers` cores
+# (no nested GridSearchCV/RandomForest parallelism). Candidate selection and the
+# final refit mirror GridSearchCV exactly, so with the same seeds the saved
+# models are identical to a sequential `train_models.py` run.
+#
+#   python src/train_models.py --workers 8
+#   python src/train_orchestrator.py --workers 8
+import os
+import time
+import argparse
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+
+from train_models import (DATA_DIR, DATASETS, PARAM_GRID, base_estimator,
+                          load_training_data, evaluate_and_save)
+import training_manifest
+
+
+def _timed_fit(params, X, y, train_idx=None, test_idx=None):
+    """Fit one forest; score it on test_idx (CV task) or return it (refit task)."""
+    wall_start = time.time()
+    cpu_start = time.process_time()
+    est = clone(base_estimator(n_jobs=1)).set_params(**params)
+    if train_idx is None:
+        est.fit(X, y)
+        result = est
+    else:
+        est.fit(X.iloc[train_idx], y.iloc[train_idx])
+        try:
+            proba = est.predict_proba(X.iloc[test_idx])[:, 1]
+            result = roc_auc_score(y.iloc[test_idx], proba)
+        except (IndexError, ValueError):
+            # single-class fold: GridSearchCV records error_score=nan
+            result = np.nan
+    return result, time.process_time() - cpu_start, wall_start, time.time()
+
+
+def _best_index(scores):
+    # scores: (n_candidates, n_splits); same mean/tie-breaking as GridSearchCV
+    means = np.average(scores, axis=1)
+    if np.isnan(means).all():
+        return 0
+    means = np.nan_to_num(means, nan=np.nanmin(means) - 1)
+    return int(np.argmax(means))
+
+
+def _usage(timings, workers):
+    cpu = sum(t[0] for t in timings)
+    wall = max(t[2] for t in timings) - min(t[1] for t in timings)
+    return cpu, wall, cpu / (wall * workers) if wall > 0 else 0.0
+
+
+def train_all(workers=None, datasets=None, param_grid=None, n_splits=5, force=False):
+    workers = workers or os.cpu_count()
+    datasets = datasets or DATASETS
+    param_grid = param_grid or PARAM_GRID
+    candidates = list(ParameterGrid(param_grid))
+    start = time.time()
+
+    manifest = training_manifest.load_manifest()
+    jobs = {}
+    for csv_name, features, model_name in datasets:
+        csv_path = os.path.join(DATA_DIR, csv_name)
+        if not os.path.exists(csv_path):
+            print("Missing", csv_path)
+            continue
+        inputs = training_manifest.training_inputs(csv_path, features, param_grid)
+        if not force and training_manifest.is_up_to_date(model_name, inputs, manifest):
+            print(f"{model_name}: inputs unchanged, skipping (use --force to retrain)")
+            continue
+        print(f"Loading {model_name}: ", end="")
+        X_train, X_test, y_train, y_test = load_training_data(csv_path, features)
+        folds = list(StratifiedKFold(n_splits=n_splits).split(X_train, y_train))
+        jobs[model_name] = {"features": features, "data": (X_train, X_test, y_train, y_test),
+                            "folds": folds, "timings": [], "inputs": inputs}
+    if not jobs:
+        print("All models are up to date.")
+        return {}
+
+    tasks = [(name, ci, fi) for name, job in jobs.items()
+             for ci in range(len(candidates)) for fi in range(len(job["folds"]))]
+    print(f"\nScheduling {len(tasks)} CV fits for {len(jobs)} models on {workers} workers")
+
+    with Parallel(n_jobs=workers) as pool:
+        cv_results = pool(
+            delayed(_timed_fit)(candidates[ci], jobs[name]["data"][0], jobs[name]["data"][2],
+                                *jobs[name]["folds"][fi])
+            for name, ci, fi in tasks
+        )
+
+        for name, job in jobs.items():
+            job["scores"] = np.full((len(candidates), len(job["folds"])), np.nan)
+        for (name, ci, fi), (score, cpu, t0, t1) in zip(tasks, cv_results):
+            jobs[name]["scores"][ci, fi] = score
+            jobs[name]["timings"].append((cpu, t0, t1))
+
+        names = list(jobs)
+        best = {name: candidates[_best_index(jobs[name]["scores"])] for name in names}
+        refits = pool(
+            delayed(_timed_fit)(best[name], jobs[name]["data"][0], jobs[name]["data"][2])
+            for name in names
+        )
+
+    report = {}
+    for name, (model, cpu, t0, t1) in zip(names, refits):
+        job = jobs[name]
+        job["timings"].append((cpu, t0, t1))
+        X_train, X_test, y_train, y_test = job["data"]
+        print(f"\n{name}: best params {best[name]}")
+        lineage = training_manifest.lineage(job["inputs"])
+        acc, auc = evaluate_and_save(model, X_test, y_test, job["features"], name,
+                                     extra_meta={"search": "grid", "lineage": lineage})
+        training_manifest.record(name, job["inputs"], lineage)
+        cpu_s, wall_s, util = _usage(job["timings"], workers)
+        report[name] = {"params": best[name], "accuracy": acc, "auc": auc,
+                        "wall_s": wall_s, "cpu_s": cpu_s, "cpu_utilisation": util}
+
+    total_wall = time.time() - start
+    print(f"\n{'model':<12}{'wall s':>10}{'cpu s':>10}{'cpu util':>10}")
+    for name, r in report.items():
+        print(f"{name:<12}{r['wall_s']:>10.1f}{r['cpu_s']:>10.1f}{r['cpu_utilisation']:>10.0%}")
+    print(f"Total wall time: {total_wall:.1f}s on {workers} workers")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train all disaster models in one shared worker pool.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true",
+                        help="retrain every model even if its inputs are unchanged")
+    args = parser.parse_args()
+    train_all(workers=args.workers, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
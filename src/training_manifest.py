@@ -0,0 +1,82 @@
+# Training manifest: records what each saved model was trained from, so
+# train_models only retrains models whose inputs changed.
+#
+# A model's inputs are the dataset's content hash, the feature list, the
+# parameter grid, the search strategy and the library versions. The manifest
+# lives in models/training_manifest.json; the same record is stored in the
+# model's meta["lineage"].
+import os
+import sys
+import json
+import hashlib
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from model_utils import MODELS_DIR, file_sha256, model_exists, artifact_sha256
+
+MANIFEST_PATH = os.path.join(MODELS_DIR, "training_manifest.json")
+
+
+def lib_versions() -> dict:
+    return {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scikit-learn": sklearn.__version__,
+    }
+
+
+def training_inputs(csv_path, features, param_grid, search="grid", label_col="label") -> dict:
+    inputs = {
+        "dataset": os.path.basename(csv_path),
+        "dataset_sha256": file_sha256(csv_path),
+        "features": list(features),
+        "label_col": label_col,
+        "param_grid": param_grid,
+        "search": search,
+        "versions": lib_versions(),
+    }
+    inputs["fingerprint"] = hashlib.sha256(
+        json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+    return inputs
+
+
+def load_manifest(path: str = None) -> dict:
+    path = path or MANIFEST_PATH
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: str = None):
+    path = path or MANIFEST_PATH
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, default=str)
+    os.replace(tmp, path)
+
+
+def is_up_to_date(model_name: str, inputs: dict, manifest: dict = None) -> bool:
+    """True if the saved model was trained from exactly these inputs."""
+    manifest = load_manifest() if manifest is None else manifest
+    entry = manifest.get(model_name)
+    return bool(entry) and entry["inputs"]["fingerprint"] == inputs["fingerprint"] and model_exists(model_name)
+
+
+def lineage(inputs: dict) -> dict:
+    """Record stored in meta["lineage"] of the trained model."""
+    return dict(inputs, trained_at=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+
+
+def record(model_name: str, inputs: dict, lineage_record: dict = None):
+    manifest = load_manifest()
+    manifest[model_name] = {
+        "inputs": inputs,
+        "trained_at": (lineage_record or lineage(inputs))["trained_at"],
+        "artifact_sha256": artifact_sha256(model_name),
+    }
+    save_manifest(manifest)
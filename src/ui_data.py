@@ -0,0 +1,133 @@
+# Cached data access for the Streamlit app.
+#
+# Streamlit re-runs app.py on every widget interaction. Reads here are cached
+# with st.cache_data / st.cache_resource and keyed on a version token per
+# table; the write helpers below bump only the token of what they changed, so
+# unrelated reruns are served from memory. Tokens live in a cache_resource,
+# i.e. they are shared by every session of the server process.
+# Writes made by other processes (ingest server, score_csv, retraining) are
+# picked up when the TTLs below expire.
+import os
+import threading
+
+import streamlit as st
+
+import utils_db
+import predictors
+from model_utils import load_model
+
+ALERTS_TTL_S = float(os.environ.get("UI_ALERTS_TTL_S", 10))
+DATASETS_TTL_S = float(os.environ.get("UI_DATASETS_TTL_S", 300))
+MODEL_TTL_S = float(os.environ.get("UI_MODEL_TTL_S", 60))
+
+
+@st.cache_resource
+def _tokens():
+    return {"lock": threading.Lock(), "alerts": 0, "datasets": 0, "models": 0}
+
+
+def version(table: str) -> int:
+    return _tokens()[table]
+
+
+def bump(*tables):
+    tokens = _tokens()
+    with tokens["lock"]:
+        for t in tables:
+            tokens[t] += 1
+
+
+@st.cache_resource
+def migrate():
+    # once per server process, so an older database gets the columns the alert views select
+    import db_init
+    db_init.migrate()
+    return True
+
+
+@st.cache_resource
+def warm_up():
+    if os.environ.get("MODEL_WARM_UP", "1") != "1":
+        return None
+    return predictors.warm_up(background=True)
+
+
+# -- reads ------------------------------------------------------------------
+@st.cache_data(ttl=ALERTS_TTL_S, max_entries=256, show_spinner=False)
+def _alerts_page(token, limit, cursor, filters):
+    return utils_db.list_alerts_page(limit=limit, cursor=cursor, **dict(filters))
+
+
+def alerts_page(limit: int = 20, cursor: tuple = None, **filters):
+    """Cached utils_db.list_alerts_page."""
+    return _alerts_page(version("alerts"), limit, cursor, tuple(sorted(filters.items())))
+
+
+@st.cache_data(ttl=DATASETS_TTL_S, show_spinner=False)
+def _datasets(token):
+    return utils_db.list_datasets()
+
+
+def datasets():
+    """Cached utils_db.list_datasets."""
+    return _datasets(version("datasets"))
+
+
+@st.cache_resource(ttl=MODEL_TTL_S, max_entries=16, show_spinner=False)
+def _model(name, token):
+    return load_model(name)
+
+
+def model(name: str):
+    """load_model(name) without the per-rerun stat() of the registry's freshness check."""
+    return _model(name, version("models"))
+
+
+# -- writes -----------------------------------------------------------------
+def predict(disaster: str, features: dict, location: str = None):
+    res = predictors.predict(disaster, features, location=location)
+    if res["alert"]:
+        utils_db.flush_writes()
+        bump("alerts")
+    return res
+
+
+def predict_all(features: dict, location: str = None, disasters=None):
+    res = predictors.predict_all(features, location=location, disasters=disasters)
+    if res["alerts"]:
+        utils_db.flush_writes()
+        bump("alerts")
+    return res
+
+
+def add_alert(disaster: str, probability: float, message: str):
+    utils_db.add_alert(disaster, probability, message)
+    utils_db.flush_writes()
+    bump("alerts")
+
+
+def delete_alert(alert_id: int):
+    utils_db.delete_alert(alert_id)
+    bump("alerts")
+
+
+def mark_alerts_handled(**filters) -> int:
+    n = utils_db.mark_alerts_handled(**filters)
+    bump("alerts")
+    return n
+
+
+def delete_alerts(**filters) -> int:
+    n = utils_db.delete_alerts(**filters)
+    bump("alerts")
+    return n
+
+
+def add_dataset(name: str, filename: str):
+    utils_db.add_dataset(name, filename)
+    bump("datasets")
+
+
+def delete_dataset(filename: str):
+    utils_db.delete_dataset(filename)
+    bump("datasets")
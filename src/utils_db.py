@@ -1,77 +1,280 @@
 # DB helper functions
-import sqlite3
+# Every call borrows a connection from the pooled engine in storage.py.
 import os
 from typing import List, Dict
+import storage
+from storage import text, bindparam
+from metrics import timed
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "disaster_alert.db")
 DB_PATH = os.path.abspath(DB_PATH)
 
+# Optional write-behind mode for log_event/add_alert (see write_behind.py)
+_writer = None
+
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    """Pooled DB-API connection (qmark SQL, SQLite); close() returns it to the pool."""
+    return storage.raw_connection(DB_PATH)
+
+def _rows(result):
+    return [tuple(r) for r in result]
+
+def enable_write_behind(**kwargs):
+    """
+    Route log_event/add_alert/record_predictions through a background
+    group-commit writer. kwargs are passed to WriteBehindWriter.
+    """
+    global _writer
+    from write_behind import WriteBehindWriter
+    if storage.dialect(DB_PATH) != "sqlite":
+        raise ValueError("write-behind mode is only available for the SQLite database")
+    if _writer is None:
+        _writer = WriteBehindWriter(DB_PATH, **kwargs)
+    return _writer
 
+def disable_write_behind():
+    """Flush pending rows and go back to synchronous writes."""
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+def flush_writes():
+    if _writer is not None:
+        _writer.flush()
+
+def write_behind_stats():
+    return _writer.stats() if _writer is not None else None
+
+@timed("db.add_dataset")
 def add_dataset(name: str, filename: str):
-    conn = get_conn(); c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO datasets (name, filename) VALUES (?,?)", (name, filename))
-    conn.commit()
-    conn.close()
+    with storage.begin(DB_PATH) as conn:
+        conn.execute(text("INSERT INTO datasets (name, filename) VALUES (:name, :filename) "
+                          "ON CONFLICT (filename) DO UPDATE SET name=excluded.name, "
+                          "uploaded_at=CURRENT_TIMESTAMP"),
+                     {"name": name, "filename": filename})
 
+@timed("db.list_datasets")
 def list_datasets():
-    conn = get_conn(); c = conn.cursor()
-    c.execute("SELECT id,name,filename,uploaded_at FROM datasets ORDER BY uploaded_at DESC")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    with storage.connect(DB_PATH) as conn:
+        return _rows(conn.execute(text(
+            "SELECT id,name,filename,uploaded_at FROM datasets ORDER BY uploaded_at DESC")))
+
+@timed("db.get_user")
+def get_user(username: str):
+    """(id, username, password_hash, role) or None."""
+    with storage.connect(DB_PATH) as conn:
+        row = conn.execute(text("SELECT id,username,password_hash,role FROM users WHERE username=:u"),
+                           {"u": username}).first()
+    return tuple(row) if row else None
 
+_LOG_SQL = "INSERT INTO logs (event_type, details) VALUES (:event_type, :details)"
+_ALERT_SQL = "INSERT INTO alerts (disaster, probability, message) VALUES (:disaster, :probability, :message)"
+
+@timed("db.log_event")
 def log_event(event_type: str, details: str):
-    conn = get_conn(); c = conn.cursor()
-    c.execute("INSERT INTO logs (event_type, details) VALUES (?,?)", (event_type, details))
-    conn.commit()
-    conn.close()
+    if _writer is not None:
+        _writer.submit("log", (event_type, details))
+        return
+    with storage.begin(DB_PATH) as conn:
+        conn.execute(text(_LOG_SQL), {"event_type": event_type, "details": details})
 
+@timed("db.add_alert")
 def add_alert(disaster: str, probability: float, message: str):
-    conn = get_conn(); c = conn.cursor()
-    c.execute("INSERT INTO alerts (disaster, probability, message) VALUES (?,?,?)", (disaster, probability, message))
-    conn.commit()
-    conn.close()
+    if _writer is not None:
+        _writer.submit("alert", (disaster, probability, message))
+        return
+    with storage.begin(DB_PATH) as conn:
+        conn.execute(text(_ALERT_SQL), {"disaster": disaster, "probability": probability, "message": message})
+
+@timed("db.record_predictions")
+def record_predictions(alerts: List[tuple], logs: List[tuple]):
+    """
+    Insert many alert rows (disaster, probability, message) and log rows
+    (event_type, details) in a single transaction (in write-behind mode, as
+    one queue item, so they still commit together).
+    """
+    if _writer is not None:
+        _writer.submit_group([("alert", r) for r in alerts] + [("log", r) for r in logs])
+        return
+    with storage.begin(DB_PATH) as conn:
+        if alerts:
+            conn.execute(text(_ALERT_SQL), [{"disaster": d, "probability": p, "message": m} for d, p, m in alerts])
+        if logs:
+            conn.execute(text(_LOG_SQL), [{"event_type": e, "details": d} for e, d in logs])
 
+@timed("db.write_alert_groups")
+def write_alert_groups(inserts: List[tuple], updates: List[tuple]):
+    """
+    Write collapsed alert rows (see alert_suppression.py) in one transaction.
+    inserts: (disaster, location, probability, message, occurrences, peak_probability,
+    first_seen, last_seen); updates: (probability, message, occurrences,
+    peak_probability, last_seen, id). Only unhandled rows are updated.
+    Returns (ids of the inserted rows, ids of updates whose row was deleted or
+    handled meanwhile). Always synchronous, since updates need the ids of earlier inserts.
+    """
+    insert_sql = text(
+        "INSERT INTO alerts (disaster, location, probability, message, occurrences, "
+        "peak_probability, first_seen, last_seen, timestamp) VALUES (:disaster, :location, "
+        ":probability, :message, :occurrences, :peak_probability, :first_seen, :last_seen, :first_seen) "
+        "RETURNING id")
+    insert_keys = ("disaster", "location", "probability", "message", "occurrences",
+                   "peak_probability", "first_seen", "last_seen")
+    update_keys = ("probability", "message", "occurrences", "peak_probability", "last_seen", "id")
+    update_sql = text("UPDATE alerts SET probability=:probability, message=:message, "
+                      "occurrences=:occurrences, peak_probability=:peak_probability, "
+                      "last_seen=:last_seen WHERE id=:id AND handled=0")
+    ids, gone = [], []
+    with storage.begin(DB_PATH) as conn:
+        for row in inserts:
+            ids.append(conn.execute(insert_sql, dict(zip(insert_keys, row))).scalar_one())
+        # one statement per row: the rowcount tells which rows no longer take updates
+        for row in updates:
+            if conn.execute(update_sql, dict(zip(update_keys, row))).rowcount == 0:
+                gone.append(row[-1])
+    return ids, gone
+
+@timed("db.list_alerts")
 def list_alerts(unhandled_only: bool=True):
-    conn = get_conn(); c = conn.cursor()
+    sql = "SELECT id,disaster,probability,message,timestamp,handled FROM alerts"
     if unhandled_only:
-        c.execute("SELECT id,disaster,probability,message,timestamp,handled FROM alerts WHERE handled=0 ORDER BY timestamp DESC")
-    else:
-        c.execute("SELECT id,disaster,probability,message,timestamp,handled FROM alerts ORDER BY timestamp DESC")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+        sql += " WHERE handled=0"
+    with storage.connect(DB_PATH) as conn:
+        return _rows(conn.execute(text(sql + " ORDER BY timestamp DESC")))
+
+def _alert_filters(ids=None, disaster: str = None, handled: bool = None, since: str = None,
+                   until: str = None):
+    """(SQL conditions, bind params, bindparams) shared by the alert listing and bulk operations."""
+    where, params, binds = [], {}, []
+    if ids is not None:
+        where.append("id IN :ids"); params["ids"] = [int(i) for i in ids]
+        binds.append(bindparam("ids", expanding=True))
+    if disaster:
+        where.append("disaster=:disaster"); params["disaster"] = disaster
+    if handled is not None:
+        where.append("handled=:handled"); params["handled"] = 1 if handled else 0
+    if since:
+        where.append("timestamp>=:since"); params["since"] = since
+    if until:
+        where.append("timestamp<:until"); params["until"] = until
+    return where, params, binds
 
+@timed("db.list_alerts_page")
+def list_alerts_page(limit: int = 20, cursor: tuple = None, disaster: str = None,
+                     handled: bool = None, since: str = None, until: str = None):
+    """
+    Keyset-paginated alerts, newest first.
+    cursor is the (timestamp, id) of the last row of the previous page; since is
+    inclusive and until exclusive ('YYYY-MM-DD HH:MM:SS' strings).
+    Rows are (id, disaster, probability, message, timestamp, handled, location,
+    occurrences, peak_probability, last_seen).
+    Returns (rows, next_cursor) where next_cursor is None on the last page.
+    """
+    where, params, _ = _alert_filters(disaster=disaster, handled=handled, since=since, until=until)
+    if cursor:
+        where.append("(timestamp, id) < (:cursor_ts, :cursor_id)")
+        params["cursor_ts"], params["cursor_id"] = cursor
+    sql = ("SELECT id,disaster,probability,message,timestamp,handled,"
+           "location,occurrences,peak_probability,last_seen FROM alerts")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY timestamp DESC, id DESC LIMIT :limit"
+    params["limit"] = limit + 1
+
+    with storage.connect(DB_PATH) as conn:
+        rows = _rows(conn.execute(text(sql), params))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][4], rows[-1][0])
+    return rows, next_cursor
+
+@timed("db.list_log_rollups")
+def list_log_rollups(since: str = None, event_type: str = None, disaster: str = None):
+    """
+    Hourly log aggregates written by retention.py, oldest first:
+    (hour, event_type, disaster, count, mean_probability, max_probability).
+    """
+    where, params = [], {}
+    if since:
+        where.append("hour>=:since"); params["since"] = since
+    if event_type:
+        where.append("event_type=:event_type"); params["event_type"] = event_type
+    if disaster:
+        where.append("disaster=:disaster"); params["disaster"] = disaster
+    sql = ("SELECT hour, event_type, disaster, count, "
+           "CASE WHEN prob_count > 0 THEN prob_sum / prob_count END, prob_max FROM log_rollups")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY hour, event_type, disaster"
+    with storage.connect(DB_PATH) as conn:
+        return _rows(conn.execute(text(sql), params))
+
+@timed("db.mark_alert_handled")
 def mark_alert_handled(alert_id:int):
-    conn = get_conn(); c = conn.cursor()
-    c.execute("UPDATE alerts SET handled=1 WHERE id=?", (alert_id,))
-    conn.commit()
-    conn.close()
+    with storage.begin(DB_PATH) as conn:
+        conn.execute(text("UPDATE alerts SET handled=1 WHERE id=:id"), {"id": alert_id})
+
+@timed("db.mark_alerts_handled")
+def mark_alerts_handled(ids=None, disaster: str = None, since: str = None, until: str = None) -> int:
+    """
+    Mark every unhandled alert matching the filters (and/or in ids) handled,
+    in one UPDATE. No filters means all of them. Returns the number of rows changed.
+    """
+    where, params, binds = _alert_filters(ids, disaster, False, since, until)
+    sql = text("UPDATE alerts SET handled=1 WHERE " + " AND ".join(where)).bindparams(*binds)
+    with storage.begin(DB_PATH) as conn:
+        return conn.execute(sql, params).rowcount
+
+@timed("db.delete_alert")
+def delete_alert(alert_id: int):
+    with storage.begin(DB_PATH) as conn:
+        conn.execute(text("DELETE FROM alerts WHERE id=:id"), {"id": alert_id})
+
+@timed("db.delete_alerts")
+def delete_alerts(ids=None, disaster: str = None, handled: bool = None, since: str = None,
+                  until: str = None) -> int:
+    """
+    Delete every alert matching the filters (and/or in ids) in one DELETE.
+    At least one filter is required. Returns the number of rows deleted.
+    """
+    where, params, binds = _alert_filters(ids, disaster, handled, since, until)
+    if not where:
+        raise ValueError("delete_alerts needs at least one filter")
+    sql = text("DELETE FROM alerts WHERE " + " AND ".join(where)).bindparams(*binds)
+    with storage.begin(DB_PATH) as conn:
+        return conn.execute(sql, params).rowcount
+
+@timed("db.delete_dataset")
+def delete_dataset(filename: str):
+    with storage.begin(DB_PATH) as conn:
+        conn.execute(text("DELETE FROM datasets WHERE filename=:filename"), {"filename": filename})
 
+@timed("db.sync_datasets_with_folder")
 def sync_datasets_with_folder(data_dir: str):
     """
     Auto-sync files in /data folder with datasets table.
     Only adds missing ones. Never deletes anything.
     """
-    conn = get_conn()
-    c = conn.cursor()
+    with storage.begin(DB_PATH) as conn:
+        # Get existing dataset filenames from DB
+        db_files = {row[0] for row in conn.execute(text("SELECT filename FROM datasets"))}
 
-    # Get existing dataset filenames from DB
-    c.execute("SELECT filename FROM datasets")
-    db_files = {row[0] for row in c.fetchall()}
+        # Scan the actual folder
+        folder_files = {f for f in os.listdir(data_dir) if f.endswith(".csv")}
 
-    # Scan the actual folder
-    folder_files = {f for f in os.listdir(data_dir) if f.endswith(".csv")}
+        # Insert only missing files
+        missing = [{"name": f.replace("_dataset.csv", "").replace(".csv", ""), "filename": f}
+                   for f in folder_files if f not in db_files]
+        if missing:
+            conn.execute(text("INSERT INTO datasets (name, filename) VALUES (:name, :filename)"), missing)
 
-    # Insert only missing files
+    # Make sure every CSV has an up-to-date columnar cache
+    from dataset_cache import build_cache
     for f in folder_files:
-        if f not in db_files:
-            name = f.replace("_dataset.csv", "").replace(".csv", "")
-            c.execute("INSERT OR REPLACE INTO datasets (name, filename) VALUES (?,?)",
-                      (name, f))
+        build_cache(os.path.join(data_dir, f))
 
-    conn.commit()
-    conn.close()
 
+if os.environ.get("DB_WRITE_BEHIND") == "1":
+    enable_write_behind()
@@ -0,0 +1,172 @@
+# Write-behind writer for logs/alerts: one long-lived connection borrowed from
+# the storage.py pool (WAL, busy timeout), a bounded queue and a background
+# thread that group-commits batches of rows. A batch that fails to commit is
+# rolled back, logged and counted as dropped; the thread keeps running.
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import storage
+
+log = logging.getLogger(__name__)
+
+_INSERT_SQL = {
+    "alert": "INSERT INTO alerts (disaster, probability, message) VALUES (?,?,?)",
+    "log": "INSERT INTO logs (event_type, details) VALUES (?,?)",
+}
+_STOP = object()
+_GROUP = "group"  # queue item holding several (kind, row) pairs, see submit_group
+
+
+class WriteBehindWriter:
+    """
+    Queue rows and commit them in batches from a background thread.
+
+    A batch is committed when it reaches batch_size rows or when flush_interval
+    seconds have passed since its first row, whichever comes first. When the
+    queue holds max_queue rows, producers block (backpressure) for up to
+    put_timeout seconds (None = wait forever) before queue.Full is raised.
+    Rows are only visible to readers after their batch commits.
+    """
+
+    def __init__(self, db_path: str, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.05, put_timeout: float = None,
+                 synchronous: str = "NORMAL"):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        # held until close(); the pool already set WAL and the busy timeout
+        self._conn = storage.raw_connection(db_path)
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._stats_lock = threading.Lock()
+        self._commit_latencies = deque(maxlen=1000)
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # -- producer side --------------------------------------------------
+    def submit(self, kind: str, row: tuple):
+        if self._closed:
+            raise RuntimeError("write-behind writer is closed")
+        self._queue.put((kind, row), block=True, timeout=self.put_timeout)
+        with self._stats_lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def submit_many(self, kind: str, rows):
+        for row in rows:
+            self.submit(kind, row)
+
+    def submit_group(self, items):
+        """Queue [(kind, row), ...] as one item, so all of its rows commit in the same batch."""
+        items = list(items)
+        if not items:
+            return
+        if self._closed:
+            raise RuntimeError("write-behind writer is closed")
+        self._queue.put((_GROUP, items), block=True, timeout=self.put_timeout)
+        with self._stats_lock:
+            self.enqueued += len(items)
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def flush(self):
+        """Block until everything queued so far has been committed."""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # pool default, before handing it back
+        self._conn.close()
+
+    # -- consumer side --------------------------------------------------
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._commit(batch)
+            finally:
+                # always, so flush() can't wait on rows that will never be written
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _commit(self, batch):
+        grouped = {}
+        n_rows = 0
+        for kind, payload in batch:
+            for kind, row in (payload if kind == _GROUP else [(kind, payload)]):
+                grouped.setdefault(kind, []).append(row)
+                n_rows += 1
+        start = time.perf_counter()
+        try:
+            for kind, rows in grouped.items():
+                self._conn.executemany(_INSERT_SQL[kind], rows)
+            self._conn.commit()
+        except Exception:
+            try:
+                self._conn.rollback()
+            except Exception:
+                log.exception("write-behind rollback failed")
+            with self._stats_lock:
+                self.errors += 1
+                self.dropped += n_rows
+            log.exception("write-behind commit failed, %d rows dropped", n_rows)
+            return
+        latency = time.perf_counter() - start
+        with self._stats_lock:
+            self.written += n_rows
+            self.batches += 1
+            self._commit_latencies.append(latency)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lat = sorted(self._commit_latencies)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "batches": self.batches,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "avg_batch_size": self.written / self.batches if self.batches else 0.0,
+                "commit_ms_avg": 1000 * sum(lat) / len(lat) if lat else 0.0,
+                "commit_ms_p99": 1000 * lat[min(len(lat) - 1, int(0.99 * len(lat)))] if lat else 0.0,
+                "commit_ms_max": 1000 * lat[-1] if lat else 0.0,
+            }